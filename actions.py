@@ -2,25 +2,103 @@
 Actions Agent - MCP Server using FastMCP
 Provides pure MCP tools - NO hardcoded menus or dishes
 """
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Context
+import asyncio
+from collections import deque
 from datetime import datetime
-import json
+import logging
 import os
+import sys
+import types
 from dotenv import load_dotenv
 
+from json_utils import json_loads, json_dumps, json_line
+from log_setup import configure_logging
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Resolved once; generate_final_menu only checks the cached value
+_API_KEY = os.getenv('GEMINI_API_KEY')
+
+log = logging.getLogger(__name__)
+
 # Initialize FastMCP server
 mcp = FastMCP("North Indian Food Menu Tools")
 
+PREFERENCES_FILE = "user_preferences.json"
+
+# Parsed copy of PREFERENCES_FILE, keyed by the file's mtime
+_prefs_cache = {"mtime": None, "data": None}
+
+def _load_prefs() -> dict:
+    """Load the preferences file, reusing the cached copy while it is unchanged
+    
+    Returns {} if the file doesn't exist.
+    """
+    try:
+        mtime = os.stat(PREFERENCES_FILE).st_mtime_ns
+        if _prefs_cache["mtime"] == mtime:
+            return _prefs_cache["data"]
+        
+        with open(PREFERENCES_FILE, 'rb') as f:
+            data = json_loads(f.read())
+    except FileNotFoundError:
+        _prefs_cache["mtime"] = None
+        return {}
+    _prefs_cache["mtime"] = mtime
+    _prefs_cache["data"] = data
+    return data
+
+# Meal history is append-only JSONL, one meal per line, newest last
+MEAL_HISTORY_FILE = "meal_history.jsonl"
+MAX_MEAL_HISTORY = 30
+
+# Lines currently in MEAL_HISTORY_FILE; unknown until the first compaction
+_history_lines = None
+
+def _read_history_tail(n: int) -> list:
+    """Parse only the last n meals from the history file"""
+    try:
+        with open(MEAL_HISTORY_FILE, 'rb') as f:
+            lines = deque(f, maxlen=n)
+    except FileNotFoundError:
+        return []
+    
+    meals = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            meals.append(json_loads(line))
+        except ValueError as e:
+            # e.g. a line left half-written by an interrupted append
+            print(f"Skipping corrupt meal history line: {e}", file=sys.stderr)
+    return meals
+
+def _compact_history():
+    """Truncate the history file to the last MAX_MEAL_HISTORY meals"""
+    global _history_lines
+    try:
+        with open(MEAL_HISTORY_FILE, 'rb') as f:
+            lines = [line for line in deque(f, maxlen=MAX_MEAL_HISTORY) if line.strip()]
+    except FileNotFoundError:
+        lines = []
+    
+    tmp_path = MEAL_HISTORY_FILE + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.writelines(line if line.endswith(b"\n") else line + b"\n" for line in lines)
+    os.replace(tmp_path, MEAL_HISTORY_FILE)
+    _history_lines = len(lines)
+
 # ============================================================================
 # TOOL 1: Get Current Date/Time/Day
 # ============================================================================
 @mcp.tool()
 def check_calendar() -> dict:
     """Get current date, day of week, and time information"""
-    print("CALLED: check_calendar()")
+    # DecisionAgent computes this locally (decision.get_calendar_info); kept for other MCP clients
+    log.debug("CALLED: check_calendar()")
     now = datetime.now()
     return {
         "date": now.strftime("%Y-%m-%d"),
@@ -42,20 +120,21 @@ def get_meal_history(days: int = 7) -> dict:
     Args:
         days: Number of days to look back (default: 7)
     """
-    print(f"CALLED: get_meal_history(days={days})")
+    log.debug("CALLED: get_meal_history(days=%s)", days)
     try:
-        if os.path.exists("user_preferences.json"):
-            with open("user_preferences.json", 'r') as f:
-                prefs = json.load(f)
-                history = prefs.get("meal_history", [])
-                recent = history[-days:] if len(history) > days else history
-                return {
-                    "recent_meals": recent,
-                    "count": len(recent),
-                    "note": f"Last {len(recent)} meals retrieved"
-                }
+        # Meals recorded in the preferences file predate the JSONL history;
+        # the bounded deque keeps only the newest `days` of both
+        history = deque(_load_prefs().get("meal_history", []), maxlen=max(days, 0))
+        history.extend(_read_history_tail(days))
+        recent = list(history)
+        if recent:
+            return {
+                "recent_meals": recent,
+                "count": len(recent),
+                "note": f"Last {len(recent)} meals retrieved"
+            }
     except Exception as e:
-        print(f"Error reading meal history: {e}")
+        print(f"Error reading meal history: {e}", file=sys.stderr)
     
     return {
         "recent_meals": [],
@@ -66,87 +145,39 @@ def get_meal_history(days: int = 7) -> dict:
 # ============================================================================
 # TOOL 3: Get User Preferences
 # ============================================================================
+# Default preferences (read-only, shared by every call)
+_DEFAULT_PREFS = types.MappingProxyType({
+    "taste": "spicy",
+    "food_style": "modern",
+    "ingredients": ("wheat flour", "pulses", "rice"),
+    "dietary_type": "vegetarian",
+    "avoid_ingredients": ()
+})
+
 @mcp.tool()
 def get_user_preferences() -> dict:
     """Get stored user preferences"""
-    print("CALLED: get_user_preferences()")
+    log.debug("CALLED: get_user_preferences()")
     
     try:
-        if os.path.exists("user_preferences.json"):
-            with open("user_preferences.json", 'r') as f:
-                prefs = json.load(f)
-                # Don't return full history, just preferences
-                return {
-                    "taste": prefs.get("taste", "spicy"),
-                    "food_style": prefs.get("food_style", "modern"),
-                    "ingredients": prefs.get("ingredients", ["wheat flour", "pulses", "rice"]),
-                    "dietary_type": prefs.get("dietary_type", "vegetarian"),
-                    "avoid_ingredients": prefs.get("avoid_ingredients", [])
-                }
+        prefs = _load_prefs()
+        # Don't return full history, just preferences
+        return {key: prefs.get(key, default) for key, default in _DEFAULT_PREFS.items()}
     except:
         pass
     
-    # Default preferences
-    return {
-        "taste": "spicy",
-        "food_style": "modern",
-        "ingredients": ["wheat flour", "pulses", "rice"],
-        "dietary_type": "vegetarian",
-        "avoid_ingredients": []
-    }
+    return dict(_DEFAULT_PREFS)
 
 # ============================================================================
 # TOOL 4: Generate Final Menu (LLM-powered)
 # ============================================================================
-@mcp.tool()
-def generate_final_menu(context_json: str) -> dict:
-    """
-    Generate complete North Indian food menu using LLM based on all context
-    
-    Args:
-        context_json: JSON string with all context (meal_type, preferences, constraints, etc.)
-    """
-    print("CALLED: generate_final_menu()")
-    print(f"Context received: {context_json[:200]}...")
-    
-    try:
-        context = json.loads(context_json)
-        print(f"Parsed context keys: {list(context.keys())}")
-    except Exception as e:
-        print(f"Error parsing context: {e}")
-        return {
-            "success": False,
-            "error": "Invalid context JSON",
-            "menu": "Error: Could not parse context"
-        }
-    
-    # Initialize Gemini
-    api_key = os.getenv('GEMINI_API_KEY')
-    print(f"API Key status: {'Found' if api_key else 'NOT FOUND'}")
-    if api_key:
-        print(f"API Key length: {len(api_key)} chars")
-    
-    if not api_key:
-        print("ERROR: GEMINI_API_KEY environment variable is not set!")
-        print("Please set it with: export GEMINI_API_KEY='your-key'")
-        return {
-            "success": False,
-            "error": "GEMINI_API_KEY not set",
-            "menu": "Error: Cannot generate menu without API key. Please set GEMINI_API_KEY environment variable."
-        }
-    
-    try:
-        import google.generativeai as genai
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        # Build comprehensive prompt
-        prompt = f"""You are an expert North Indian food menu planner.  
+# Static menu prompt, built once at import; only the context block is filled per call
+_MENU_PROMPT_TEMPLATE = """You are an expert North Indian food menu planner.  
 Generate a complete, detailed, and practical menu for home cooking.
 
 ────────────────────────────
 CONTEXT PROVIDED:
-{json.dumps(context, indent=2)}
+{context_block}
 
 ────────────────────────────
 YOUR TASK
@@ -201,20 +232,262 @@ FORMAT YOUR RESPONSE EXACTLY LIKE THIS:
 💡 **Chef's Note
 """
 
-        response = model.generate_content(prompt)
-        menu_text = response.text.strip()
+# Appended to the menu prompt when several contexts share one LLM call
+_MENU_BATCH_INSTRUCTIONS = """
+────────────────────────────
+BATCH REQUEST
+CONTEXT PROVIDED above holds {count} independent requests (CONTEXT 1 … CONTEXT {count}).
+Create one menu per context, each formatted exactly as above.
+Respond with ONLY a JSON array of {count} strings, in the same order as the contexts, each string one complete menu.
+"""
+
+# Set MENU_BATCHING=1 to coalesce concurrent generate_final_menu calls into one Gemini request
+USE_MENU_BATCHING = os.getenv("MENU_BATCHING") == "1"
+
+class BatchingExecutor:
+    """
+    Collects menu requests for up to max_wait seconds (or max_batch requests)
+    and answers them with a single Gemini call, resolving one future per request.
+    A lone request uses the normal single-menu prompt.
+    """
+    def __init__(self, max_batch: int = 8, max_wait: float = 0.1):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []  # (context_block, future)
+        self._flush_handle = None
+        self._tasks = set()  # running batches, kept referenced until they finish
+    
+    async def submit(self, context_block: str) -> str:
+        """Queue one context and wait for its menu text"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((context_block, future))
+        
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+    
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: list):
+        from llm_client import get_model
+        model = get_model()
+        
+        try:
+            if len(batch) == 1:
+                menus = [await self._generate_one(model, batch[0][0])]
+            else:
+                menus = await self._generate_batch(model, [context_block for context_block, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
         
-        print(f"Generated menu length: {len(menu_text)} chars")
-        print(f"Generated menu preview: {menu_text[:200]}...")
+        for (_, future), menu in zip(batch, menus):
+            if not future.done():
+                future.set_result(menu)
+    
+    async def _generate_one(self, model, context_block: str) -> str:
+        response = await model.generate_content_async(_MENU_PROMPT_TEMPLATE.format(context_block=context_block))
+        return response.text.strip()
+    
+    async def _generate_batch(self, model, context_blocks: list) -> list:
+        numbered = "\n\n".join(
+            f"CONTEXT {i}:\n{context_block}" for i, context_block in enumerate(context_blocks, 1)
+        )
+        prompt = (_MENU_PROMPT_TEMPLATE.format(context_block=numbered)
+                  + _MENU_BATCH_INSTRUCTIONS.format(count=len(context_blocks)))
+        response = await model.generate_content_async(
+            prompt,
+            generation_config={"response_mime_type": "application/json"}
+        )
+        
+        try:
+            menus = json_loads(response.text)
+        except Exception:
+            menus = None
+        if not isinstance(menus, list) or len(menus) != len(context_blocks):
+            # Malformed batch answer - fall back to one call per context
+            print("Batched menu response unusable, generating individually", file=sys.stderr)
+            return list(await asyncio.gather(*[
+                self._generate_one(model, context_block) for context_block in context_blocks
+            ]))
+        return [str(menu).strip() for menu in menus]
+
+_menu_batcher = BatchingExecutor() if USE_MENU_BATCHING else None
+
+# Fixed error payloads for generate_final_menu
+_INVALID_CONTEXT_RESULT = types.MappingProxyType({
+    "success": False,
+    "error": "Invalid context JSON",
+    "menu": "Error: Could not parse context"
+})
+_NO_API_KEY_RESULT = types.MappingProxyType({
+    "success": False,
+    "error": "GEMINI_API_KEY not set",
+    "menu": "Error: Cannot generate menu without API key. Please set GEMINI_API_KEY environment variable."
+})
+
+# Prompt size limits for the context block
+MAX_PROMPT_MEALS = 5
+MAX_CONTEXT_CHARS = 4000
+_OMITTED_MARKER = "...earlier entries omitted..."
+_TRIMMED_MARKER = "...[trimmed]"
+# Text values are never cut below this when fitting the context budget
+MIN_TRIMMED_CHARS = 200
+
+def _summarize_meal(meal) -> dict:
+    """Reduce a history entry to what the LLM needs to avoid repeats"""
+    if not isinstance(meal, dict):
+        return {"meal": str(meal)[:80]}
+    summary = {
+        "meal_type": meal.get("meal_type"),
+        "main_dish_names": meal.get("main_dish_names") or meal.get("main_dishes") or meal.get("dishes") or [],
+        "date": meal.get("date") or meal.get("timestamp")
+    }
+    # Entries saved by MemoryAgent only carry the original query
+    if not summary["main_dish_names"] and meal.get("query"):
+        summary["query"] = str(meal["query"])[:80]
+    return summary
+
+def _longest_string(obj, container=None, key=None):
+    """(container, key) of the longest string anywhere in obj, or (None, None)"""
+    best = (container, key) if isinstance(obj, str) else (None, None)
+    best_len = len(obj) if isinstance(obj, str) else -1
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, list):
+        items = enumerate(obj)
+    else:
+        return best
+    for k, v in items:
+        c, ck = _longest_string(v, obj, k)
+        if c is not None and len(c[ck]) > best_len:
+            best, best_len = (c, ck), len(c[ck])
+    return best
+
+def _trim_context_history(context: dict) -> bool:
+    """Strip meal history down to short summaries of the last few meals; returns True if changed"""
+    changed = False
+    for key in ("recent_meals", "history"):
+        meals = context.get(key)
+        if isinstance(meals, list) and meals:
+            context[key] = [_summarize_meal(meal) for meal in meals[-MAX_PROMPT_MEALS:]]
+            if len(meals) > MAX_PROMPT_MEALS:
+                context[key].insert(0, _OMITTED_MARKER)
+            changed = True
+    return changed
+
+def _context_block(context_json: str, context: dict) -> str:
+    """Context JSON for the prompt, kept within MAX_CONTEXT_CHARS"""
+    changed = _trim_context_history(context)
+    
+    # Embed the caller's JSON as-is when it is already pretty-printed and
+    # untouched; it was parsed only to validate it
+    if not changed and "\n  " in context_json:
+        block = context_json
+    else:
+        block = json_dumps(context)
+    
+    # Still too long - drop the oldest meals, leaving the marker so the LLM knows
+    for key in ("recent_meals", "history"):
+        meals = context.get(key)
+        while len(block) > MAX_CONTEXT_CHARS and isinstance(meals, list) and len(meals) > 1:
+            if meals[0] == _OMITTED_MARKER:
+                meals.pop(1)
+            else:
+                meals[0] = _OMITTED_MARKER
+            block = json_dumps(context)
+    
+    # Then shorten the longest text values (long preferences or specific_requests)
+    while len(block) > MAX_CONTEXT_CHARS:
+        container, key = _longest_string(context)
+        if container is None or len(container[key]) <= MIN_TRIMMED_CHARS:
+            break
+        value = container[key]
+        excess = len(block) - MAX_CONTEXT_CHARS
+        keep = max(MIN_TRIMMED_CHARS, len(value) - excess - len(_TRIMMED_MARKER))
+        container[key] = value[:keep] + _TRIMMED_MARKER
+        block = json_dumps(context)
+    
+    # Many short values can still add up - hard cap the block itself
+    if len(block) > MAX_CONTEXT_CHARS:
+        block = block[:MAX_CONTEXT_CHARS - len(_TRIMMED_MARKER)] + _TRIMMED_MARKER
+    return block
+
+@mcp.tool()
+async def generate_final_menu(context_json: str, ctx: Context) -> dict:
+    """
+    Generate complete North Indian food menu using LLM based on all context
+    
+    Args:
+        context_json: JSON string with all context (meal_type, preferences, constraints, etc.)
+    """
+    log.debug("CALLED: generate_final_menu()")
+    log.debug("Context received: %s...", context_json[:200])
+    
+    try:
+        context = json_loads(context_json)
+        log.debug("Parsed context keys: %s", list(context.keys()))
+    except Exception as e:
+        print(f"Error parsing context: {e}", file=sys.stderr)
+        return dict(_INVALID_CONTEXT_RESULT)
+    
+    if not _API_KEY:
+        print("ERROR: GEMINI_API_KEY environment variable is not set!", file=sys.stderr)
+        print("Please set it with: export GEMINI_API_KEY='your-key'", file=sys.stderr)
+        return dict(_NO_API_KEY_RESULT)
+    
+    try:
+        # Imported here so the server starts without loading the Gemini SDK
+        from llm_client import get_model, MODEL_NAME
+        model = get_model()
+        
+        context_block = _context_block(context_json, context)
+        
+        if _menu_batcher is not None:
+            # Shares a Gemini call with any other menu requests arriving now
+            menu_text = await _menu_batcher.submit(context_block)
+        else:
+            # Only the context block changes between calls
+            prompt = _MENU_PROMPT_TEMPLATE.format(context_block=context_block)
+            
+            # Stream the menu, forwarding each chunk to the client as a progress
+            # notification so it can be shown while the rest is still generating
+            response = await model.generate_content_async(prompt, stream=True)
+            chunks = []
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (safety blocks, empty candidates)
+                    continue
+                chunks.append(text)
+                await ctx.report_progress(len(chunks), message=text)
+            menu_text = "".join(chunks).strip()
+        
+        log.debug("Generated menu length: %d chars", len(menu_text))
+        log.debug("Generated menu preview: %s...", menu_text[:200])
         
         return {
             "success": True,
             "menu": menu_text,
-            "generated_by": "gemini-2.0-flash-exp"
+            "generated_by": MODEL_NAME
         }
         
     except Exception as e:
-        print(f"Error generating menu with LLM: {e}")
+        print(f"Error generating menu with LLM: {e}", file=sys.stderr)
         return {
             "success": False,
             "error": str(e),
@@ -232,38 +505,28 @@ def save_meal_to_history(meal_data_json: str) -> dict:
     Args:
         meal_data_json: JSON string with meal information
     """
-    print(f"CALLED: save_meal_to_history()")
+    global _history_lines
+    log.debug("CALLED: save_meal_to_history()")
     
     try:
-        meal_data = json.loads(meal_data_json)
-        
-        # Load existing preferences
-        prefs = {}
-        if os.path.exists("user_preferences.json"):
-            with open("user_preferences.json", 'r') as f:
-                prefs = json.load(f)
+        meal_data = json_loads(meal_data_json)
         
         # Add timestamp
         meal_data["timestamp"] = datetime.now().isoformat()
         
-        # Add to history
-        if "meal_history" not in prefs:
-            prefs["meal_history"] = []
-        
-        prefs["meal_history"].append(meal_data)
-        
-        # Keep only last 30 meals
-        if len(prefs["meal_history"]) > 30:
-            prefs["meal_history"] = prefs["meal_history"][-30:]
+        # Keep the file near the last 30 meals; compaction runs once per 30 saves
+        if _history_lines is None or _history_lines >= 2 * MAX_MEAL_HISTORY:
+            _compact_history()
         
-        # Save
-        with open("user_preferences.json", 'w') as f:
-            json.dump(prefs, f, indent=2)
+        # Append a single line - no need to read or rewrite the existing history
+        with open(MEAL_HISTORY_FILE, 'ab') as f:
+            f.write(json_line(meal_data))
+        _history_lines += 1
         
         return {
             "success": True,
             "message": "Meal saved to history",
-            "total_meals": len(prefs["meal_history"])
+            "total_meals": min(_history_lines, MAX_MEAL_HISTORY)
         }
     except Exception as e:
         return {
@@ -272,6 +535,15 @@ def save_meal_to_history(meal_data_json: str) -> dict:
         }
 
 if __name__ == "__main__":
-    import sys
-    print("🚀 Starting North Indian Food Menu MCP Server...")
-    mcp.run(transport="stdio")
+    configure_logging()
+    print("🚀 Starting North Indian Food Menu MCP Server...", file=sys.stderr)
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+    
+    if uvloop is not None:
+        # Faster event loop for tool dispatch, without touching the global loop policy
+        uvloop.run(mcp.run_stdio_async())
+    else:
+        mcp.run(transport="stdio")
@@ -3,28 +3,79 @@ Decision Agent
 LLM freely decides which tool to call or provide final answer
 NO prescribed workflow - LLM has full autonomy
 """
-import google.generativeai as genai
-import os
 import json
+from datetime import datetime
+from llm_client import get_model
 from models import ExtractedFacts, UserPreferences
 
+# Tools whose data the agent computes locally, so they aren't offered to the LLM
+PRECOMPUTED_TOOLS = {"check_calendar"}
+
+def get_calendar_info() -> dict:
+    """Current date/time context (same fields as the check_calendar MCP tool)"""
+    now = datetime.now()
+    return {
+        "date": now.strftime("%Y-%m-%d"),
+        "day": now.strftime("%A"),
+        "time": now.strftime("%H:%M"),
+        "is_weekend": now.weekday() >= 5,
+        "month": now.strftime("%B"),
+        "year": now.year
+    }
+
 class DecisionAgent:
-    def __init__(self):
-        # Initialize Gemini
-        api_key = os.getenv('GEMINI_API_KEY')
-        if api_key:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        else:
-            self.model = None
+    def __init__(self, tools_list: list):
+        # Shared Gemini model
+        self.model = get_model()
+        if self.model is None:
             print("⚠️  Warning: GEMINI_API_KEY not set. Using fallback mode.")
+        
+        # The tools are fixed for the agent's lifetime, so build the prompts once
+        offered_tools = self._offered_tools(tools_list)
+        self._tool_names = {tool["name"] for tool in offered_tools}
+        tools_block = self.render_tools_block(offered_tools)
+        self._system_prompt = self.create_system_prompt(tools_block)
+        self._planner_prompt = self.create_system_prompt(tools_block, mode="planner")
+        
+        # Remaining steps of the plan returned by the planner call
+        self._plan = []
+        # The planner is asked once per agent, by plan_independent_tools or the first decision
+        self._plan_requested = False
+        # Results already checked for errors while replaying the plan
+        self._results_checked = 0
     
-    def create_system_prompt(self, tools_list: list) -> str:
-        """Create system prompt with available tools"""
-        tools_description = "\n".join([
+    def render_tools_block(self, tools_list: list) -> str:
+        """Format the tool list once for every prompt that embeds it"""
+        return "\n".join([
             f"{i+1}. {tool['name']}({tool['params']}) - {tool['description']}"
             for i, tool in enumerate(tools_list)
         ])
+    
+    def create_system_prompt(self, tools_description: str, mode: str = "step") -> str:
+        """Create system prompt around the pre-rendered tools block
+        
+        mode="step" asks for one tool call per response; mode="planner" asks
+        for the whole tool chain as a JSON plan in a single response.
+        """
+        if mode == "planner":
+            return f"""You are the planning stage of a Decision Agent for a North Indian food recommendation system.  
+Plan ALL the tool calls needed to generate a personalized menu for the user's request, in order, in ONE response.
+
+AVAILABLE MCP TOOLS:
+{tools_description}
+
+────────────────────────────
+RESPONSE FORMAT
+Respond with ONLY a JSON array, one object per tool call:
+[{{"tool": "get_user_preferences", "params": [], "independent": true}}, {{"tool": "get_meal_history", "params": ["7"], "independent": true}}, {{"tool": "generate_final_menu", "params": ["<fill from prior results>"]}}]
+
+────────────────────────────
+CRITICAL RULES
+- generate_final_menu must be the last step; pass "<fill from prior results>" as its param, the context is filled in for you.  
+- params are strings, in the order the tool lists them.  
+- Mark a step "independent": true when it needs no earlier step's result; independent steps at the start of the plan run concurrently.  
+- Only plan tools that help with this request; never repeat a tool.  
+- Do not include FINAL_ANSWER; it is produced after the plan has run."""
         
         return f"""You are an intelligent Decision Agent for a North Indian food recommendation system.  
 Your goal is to generate a personalized menu from the user's request.  
@@ -38,17 +89,22 @@ RESPONSE FORMAT (choose ONE)
 FUNCTION_CALL: tool_name|param1|param2|...
 FINAL_ANSWER: [complete menu text]
 
+For JSON params (generate_final_menu), name the tool alone and put the JSON on the following lines between markers:
+FUNCTION_CALL: generate_final_menu
+<<<JSON
+[JSON with all context]
+JSON>>>
+
 ────────────────────────────
 REASONING FRAMEWORK
 1. Understand intent → infer meal type, people, time, preferences, etc.  
-2. Plan relevant tools (check_calendar, get_meal_history, get_user_preferences, etc.).  
+2. Plan relevant tools (get_meal_history, get_user_preferences, etc.); today's date/time is already provided.  
 3. Execute one tool at a time; don’t repeat.  
 4. When ready, call generate_final_menu with all context as JSON.  
 5. After it returns, immediately give FINAL_ANSWER with the full menu text.
 
 ────────────────────────────
 TOOL NOTES
-- check_calendar → get day/time context  
 - get_meal_history → avoid repetition  
 - get_user_preferences → know taste/style  
 - generate_final_menu → **must be called before FINAL_ANSWER**; pass all info (meal_type, preferences, etc.)  
@@ -66,14 +122,19 @@ EXAMPLES
 
 Simple Flow  
 FUNCTION_CALL: get_user_preferences  
-FUNCTION_CALL: generate_final_menu|[JSON with meal_type and preferences]
+FUNCTION_CALL: generate_final_menu
+<<<JSON
+[JSON with meal_type and preferences]
+JSON>>>
 FINAL_ANSWER: [menu text]
 
 Thorough Flow  
-FUNCTION_CALL: check_calendar  
 FUNCTION_CALL: get_meal_history|7  
 FUNCTION_CALL: get_user_preferences  
-FUNCTION_CALL: generate_final_menu|[JSON with all context]
+FUNCTION_CALL: generate_final_menu
+<<<JSON
+[JSON with all context]
+JSON>>>
 FINAL_ANSWER: [menu text]
 
 ────────────────────────────
@@ -88,16 +149,46 @@ CRITICAL RULES
 
 YOU DECIDE what's appropriate based on the user's query!"""
     
+    def plan_independent_tools(self, perceived_facts: ExtractedFacts, memory_data: UserPreferences) -> list:
+        """
+        Steps that don't depend on each other and can run concurrently before
+        the first decision, as [{"tool": ..., "params": [...]}].
+        
+        With a model, the planner call chooses the tool chain and marks which
+        leading steps are independent; those are handed back to run together
+        and the rest of the plan is replayed by make_decision. Without one,
+        the fallback context tools are gathered and generate_final_menu
+        follows. Calendar data is computed locally, so check_calendar is
+        never one of them.
+        """
+        if not self.model:
+            self._plan = [{"tool": "generate_final_menu", "params": []}]
+            return [
+                {"tool": "get_user_preferences", "params": []},
+                {"tool": "get_meal_history", "params": ["7"]}
+            ]
+        
+        calendar_line = self._calendar_line()
+        self._plan = self._request_plan(f"{calendar_line}\n\n{self._initial_context(perceived_facts, memory_data)}")
+        
+        independent = []
+        while self._plan and self._plan[0]["independent"] and self._plan[0]["tool"] != "generate_final_menu":
+            independent.append(self._plan.pop(0))
+        return independent
+    
     def make_decision(
         self, 
         perceived_facts: ExtractedFacts, 
         memory_data: UserPreferences, 
-        action_history: list,
-        tools_list: list
+        action_history: list
     ) -> dict:
         """
         Make decision - returns either a tool call or final answer
         
+        memory_data can be the UserPreferences model or MemoryAgent's
+        preferences snapshot; only taste, food_style, ingredients and
+        dietary_type are read.
+        
         Returns:
             {
                 "type": "tool_call" or "final_answer",
@@ -109,22 +200,24 @@ YOU DECIDE what's appropriate based on the user's query!"""
         """
         iteration = len(action_history) + 1
         
+        # A successful generate_final_menu already holds the answer - pass it through
+        # instead of asking the LLM to repeat it
+        if action_history and action_history[-1].get("tool_name") == "generate_final_menu":
+            last_result = action_history[-1].get("result", {})
+            if (isinstance(last_result, dict) and last_result.get("success") is not False
+                    and isinstance(last_result.get("menu"), str) and last_result["menu"].strip()):
+                return {
+                    "type": "final_answer",
+                    "final_response": last_result["menu"],
+                    "reasoning": "Direct passthrough from generate_final_menu"
+                }
+        
+        # Date/time is computed here rather than spending an iteration on check_calendar
+        calendar_line = self._calendar_line()
+        
         # Build context with history
         if iteration == 1:
-            context = f"""USER REQUEST:
-Meal Type: {perceived_facts.meal_type}
-Number of People: {perceived_facts.number_of_people}
-Time Available: {perceived_facts.time_available}
-Specific Requests: {perceived_facts.specific_requests}
-Dietary Restrictions: {', '.join(perceived_facts.dietary_restrictions) if perceived_facts.dietary_restrictions else 'None'}
-
-USER PREFERENCES (from memory):
-Taste: {memory_data.taste}
-Food Style: {memory_data.food_style}
-Preferred Ingredients: {', '.join(memory_data.ingredients)}
-Dietary Type: {memory_data.dietary_type}
-
-This is your first decision. What tool should you call first?"""
+            context = self._initial_context(perceived_facts, memory_data)
         else:
             # Build history of what's been done
             history_lines = []
@@ -192,20 +285,37 @@ WHAT YOU'VE DONE SO FAR:
 Iteration {iteration}. What's your next step?
 (Remember: generate_final_menu creates the detailed menu, then you provide FINAL_ANSWER with that menu)"""
         
-        system_prompt = self.create_system_prompt(tools_list)
-        prompt = f"{system_prompt}\n\n{context}"
+        # Plan the whole tool chain with one LLM call, then replay it locally
+        if self.model and not self._plan_requested:
+            self._plan = self._request_plan(f"{calendar_line}\n\n{context}")
+        if self._plan:
+            # Check every result since the last step, including each concurrently gathered one
+            new_results = action_history[self._results_checked:]
+            self._results_checked = len(action_history)
+            if any(isinstance(a.get("result"), dict) and "error" in a["result"] for a in new_results):
+                # A planned tool failed - let the LLM decide step by step from here
+                self._plan = []
+            else:
+                return self._next_planned_step(perceived_facts, action_history)
+        
+        prompt = f"{self._system_prompt}\n\n{calendar_line}\n\n{context}"
         
         if self.model:
             try:
                 response = self.model.generate_content(prompt)
                 response_text = response.text.strip()
                 
-                # Find the response line
-                for line in response_text.split('\n'):
-                    line = line.strip()
-                    if line.startswith("FUNCTION_CALL:") or line.startswith("FINAL_ANSWER:"):
-                        response_text = line
-                        break
+                # A JSON payload travels in its own block, so it never needs pipe-splitting
+                json_payload = None
+                if "<<<JSON" in response_text:
+                    json_payload = response_text.partition("<<<JSON")[2].partition("JSON>>>")[0].strip()
+                
+                # Find the response line (single scan, no list of lines)
+                starts = [i for i in (response_text.find("FUNCTION_CALL:"), response_text.find("FINAL_ANSWER:")) if i != -1]
+                if starts:
+                    start = min(starts)
+                    end = response_text.find("\n", start)
+                    response_text = response_text[start:end if end != -1 else None].strip()
                 
                 print(f"🤖 LLM Response: {response_text[:100]}...")
                 
@@ -215,6 +325,8 @@ Iteration {iteration}. What's your next step?
                     parts = [p.strip() for p in function_info.split("|")]
                     tool_name = parts[0]
                     params = parts[1:] if len(parts) > 1 else []
+                    if json_payload is not None:
+                        params = [json_payload]
                     
                     return {
                         "type": "tool_call",
@@ -257,6 +369,96 @@ Iteration {iteration}. What's your next step?
         else:
             return self._fallback_decision(iteration, perceived_facts, action_history)
     
+    def _offered_tools(self, tools_list: list) -> list:
+        """Tools the LLM may call (everything except the precomputed ones)"""
+        return [tool for tool in tools_list if tool["name"] not in PRECOMPUTED_TOOLS]
+    
+    def _calendar_line(self) -> str:
+        """One-line date/time context for the prompts"""
+        calendar = get_calendar_info()
+        return f"TODAY: {calendar['day']}, {calendar['date']} {calendar['time']}{' (weekend)' if calendar['is_weekend'] else ''}"
+    
+    def _initial_context(self, perceived_facts: ExtractedFacts, memory_data: UserPreferences) -> str:
+        """Context for the first decision (and the planner call)"""
+        return f"""USER REQUEST:
+Meal Type: {perceived_facts.meal_type}
+Number of People: {perceived_facts.number_of_people}
+Time Available: {perceived_facts.time_available}
+Specific Requests: {perceived_facts.specific_requests}
+Dietary Restrictions: {', '.join(perceived_facts.dietary_restrictions) if perceived_facts.dietary_restrictions else 'None'}
+
+USER PREFERENCES (from memory):
+Taste: {memory_data.taste}
+Food Style: {memory_data.food_style}
+Preferred Ingredients: {', '.join(memory_data.ingredients)}
+Dietary Type: {memory_data.dietary_type}
+
+This is your first decision. What tool should you call first?"""
+    
+    def _request_plan(self, context: str) -> list:
+        """Ask the LLM for the full tool chain; returns [] if no usable plan comes back"""
+        self._plan_requested = True
+        prompt = f"{self._planner_prompt}\n\n{context}"
+        
+        try:
+            response = self.model.generate_content(prompt)
+            response_text = response.text.strip()
+            plan = json.loads(response_text[response_text.find("["):response_text.rfind("]") + 1])
+        except Exception as e:
+            print(f"⚠️  Could not get a plan, deciding step by step: {e}")
+            return []
+        
+        steps = []
+        for step in plan if isinstance(plan, list) else []:
+            if not isinstance(step, dict) or step.get("tool") not in self._tool_names:
+                print(f"⚠️  Ignoring invalid plan, deciding step by step: {step}")
+                return []
+            steps.append({
+                "tool": step["tool"],
+                "params": [str(p) for p in step.get("params") or []],
+                "independent": step.get("independent") is True
+            })
+        
+        print(f"🤖 LLM Plan: {' → '.join(step['tool'] for step in steps)}")
+        return steps
+    
+    def _next_planned_step(self, perceived_facts: ExtractedFacts, action_history: list) -> dict:
+        """Pop the next step of the cached plan without another LLM call"""
+        step = self._plan.pop(0)
+        tool_name = step["tool"]
+        params = step["params"]
+        
+        # The planner can't know earlier results, so build the menu context here
+        if tool_name == "generate_final_menu":
+            params = [json.dumps(self._build_menu_context(perceived_facts, action_history))]
+        
+        return {
+            "type": "tool_call",
+            "tool_name": tool_name,
+            "params": params,
+            "reasoning": f"Following plan: {tool_name}"
+        }
+    
+    def _build_menu_context(self, perceived_facts: ExtractedFacts, action_history: list) -> dict:
+        """Collect the user request and prior tool results into a generate_final_menu context"""
+        # Every extracted fact, including dietary restrictions, occasion and constraints
+        context = perceived_facts.model_dump()
+        context["calendar"] = get_calendar_info()
+        
+        # Add data from history
+        for action in action_history:
+            result = action.get("result", {})
+            if not isinstance(result, dict):
+                continue
+            tool_name = action.get("tool_name", "")
+            
+            if tool_name == "get_user_preferences":
+                context["preferences"] = result
+            elif tool_name == "get_meal_history":
+                context["recent_meals"] = result.get("recent_meals", [])
+        
+        return context
+    
     def _fallback_decision(self, iteration: int, perceived_facts: ExtractedFacts, action_history: list) -> dict:
         """Fallback decision without API"""
         
@@ -276,22 +478,7 @@ Iteration {iteration}. What's your next step?
             }
         elif iteration == 3:
             # Build context for generate_final_menu
-            context = {
-                "meal_type": perceived_facts.meal_type,
-                "number_of_people": perceived_facts.number_of_people,
-                "time_available": perceived_facts.time_available,
-                "specific_requests": perceived_facts.specific_requests
-            }
-            
-            # Add data from history
-            for action in action_history:
-                result = action.get("result", {})
-                tool_name = action.get("tool_name", "")
-                
-                if tool_name == "get_user_preferences":
-                    context["preferences"] = result
-                elif tool_name == "get_meal_history":
-                    context["recent_meals"] = result.get("recent_meals", [])
+            context = self._build_menu_context(perceived_facts, action_history)
             
             return {
                 "type": "tool_call",
@@ -1,172 +1,201 @@
 # basic import 
 from mcp.server.fastmcp import FastMCP, Image
 from mcp.server.fastmcp.prompts import base
-from mcp.types import TextContent
-from mcp import types
-from PIL import Image as PILImage, ImageDraw, ImageFont
 import math
+import operator
 import sys
-import subprocess
+from io import BytesIO
+import fast_math
+from log_setup import configure_logging
+from functools import lru_cache
+try:
+    import numpy as np
+except ImportError:
+    np = None
 import time
 import os
 import platform
+import logging
+
+logger = logging.getLogger(__name__)
 
 # instantiate an MCP server client
 mcp = FastMCP("Calculator")
 
 # DEFINE TOOLS
 
-#addition tool
+# Scalar math operations behind the single calc tool: op -> f(a, b)
+# Ops that stay exact on ints; every other op works on floats
+_INT_OPS = {"add", "sub", "mul", "pow", "mod", "mine"}
+_OPS = {
+    "add": operator.add,
+    "sub": operator.sub,
+    "mul": operator.mul,
+    "div": operator.truediv,
+    "pow": operator.pow,
+    "mod": operator.mod,
+    "mine": lambda a, b: a - b - b,
+    "sqrt": lambda a, _: fast_math.sqrt(a),
+    "cbrt": lambda a, _: fast_math.cbrt(a),
+    "log": lambda a, _: fast_math.log(a),
+    "sin": lambda a, _: fast_math.sin(a),
+    "cos": lambda a, _: fast_math.cos(a),
+    "tan": lambda a, _: fast_math.tan(a),
+}
+
+# calculator tool
 @mcp.tool()
-def add(a: int, b: int) -> int:
-    """Add two numbers"""
-    print("CALLED: add(a: int, b: int) -> int:")
-    return int(a + b)
+def calc(op: str, a: int | float, b: int | float = 0) -> int | float:
+    """Scalar math: op is one of add, sub, mul, div, pow, mod, mine (a - 2b), sqrt, cbrt, log, sin, cos, tan; unary ops ignore b"""
+    logger.debug("CALLED: calc(op=%s, a=%s, b=%s)", op, a, b)
+    func = _OPS.get(op)
+    if func is None:
+        raise ValueError(f"Unknown op '{op}'. Use one of: {', '.join(_OPS)}")
+    if op in _INT_OPS:
+        # int inputs give exact int results (e.g. large powers)
+        return func(a, b)
+    return float(func(float(a), float(b)))
 
 @mcp.tool()
 def add_list(l: list) -> int:
     """Add all numbers in a list"""
-    print("CALLED: add(l: list) -> int:")
+    logger.debug("CALLED: add(l: list) -> int:")
     return sum(l)
 
-# subtraction tool
-@mcp.tool()
-def subtract(a: int, b: int) -> int:
-    """Subtract two numbers"""
-    print("CALLED: subtract(a: int, b: int) -> int:")
-    return int(a - b)
-
-# multiplication tool
-@mcp.tool()
-def multiply(a: int, b: int) -> int:
-    """Multiply two numbers"""
-    print("CALLED: multiply(a: int, b: int) -> int:")
-    return int(a * b)
-
-#  division tool
-@mcp.tool() 
-def divide(a: int, b: int) -> float:
-    """Divide two numbers"""
-    print("CALLED: divide(a: int, b: int) -> float:")
-    return float(a / b)
-
-# power tool
-@mcp.tool()
-def power(a: int, b: int) -> int:
-    """Power of two numbers"""
-    print("CALLED: power(a: int, b: int) -> int:")
-    return int(a ** b)
-
-# square root tool
-@mcp.tool()
-def sqrt(a: int) -> float:
-    """Square root of a number"""
-    print("CALLED: sqrt(a: int) -> float:")
-    return float(a ** 0.5)
-
-# cube root tool
-@mcp.tool()
-def cbrt(a: int) -> float:
-    """Cube root of a number"""
-    print("CALLED: cbrt(a: int) -> float:")
-    return float(a ** (1/3))
-
 # factorial tool
 @mcp.tool()
 def factorial(a: int) -> int:
     """factorial of a number"""
-    print("CALLED: factorial(a: int) -> int:")
+    logger.debug("CALLED: factorial(a: int) -> int:")
     return int(math.factorial(a))
 
-# log tool
-@mcp.tool()
-def log(a: int) -> float:
-    """log of a number"""
-    print("CALLED: log(a: int) -> float:")
-    return float(math.log(a))
-
-# remainder tool
-@mcp.tool()
-def remainder(a: int, b: int) -> int:
-    """remainder of two numbers divison"""
-    print("CALLED: remainder(a: int, b: int) -> int:")
-    return int(a % b)
-
-# sin tool
-@mcp.tool()
-def sin(a: int) -> float:
-    """sin of a number"""
-    print("CALLED: sin(a: int) -> float:")
-    return float(math.sin(a))
-
-# cos tool
-@mcp.tool()
-def cos(a: int) -> float:
-    """cos of a number"""
-    print("CALLED: cos(a: int) -> float:")
-    return float(math.cos(a))
-
-# tan tool
-@mcp.tool()
-def tan(a: int) -> float:
-    """tan of a number"""
-    print("CALLED: tan(a: int) -> float:")
-    return float(math.tan(a))
-
-# mine tool
-@mcp.tool()
-def mine(a: int, b: int) -> int:
-    """special mining tool"""
-    print("CALLED: mine(a: int, b: int) -> int:")
-    return int(a - b - b)
-
 @mcp.tool()
 def create_thumbnail(image_path: str) -> Image:
     """Create a thumbnail from an image"""
-    print("CALLED: create_thumbnail(image_path: str) -> Image:")
+    logger.debug("CALLED: create_thumbnail(image_path: str) -> Image:")
+    from PIL import Image as PILImage
     img = PILImage.open(image_path)
-    img.thumbnail((100, 100))
-    return Image(data=img.tobytes(), format="png")
+    img.thumbnail((100, 100), PILImage.Resampling.LANCZOS)
+    # tobytes() is raw pixels - encode an actual PNG for the client
+    buf = BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    return Image(data=buf.getvalue(), format="png")
 
 @mcp.tool()
 def strings_to_chars_to_int(string: str) -> list[int]:
     """Return the ASCII values of the characters in a word"""
-    print("CALLED: strings_to_chars_to_int(string: str) -> list[int]:")
-    return [int(ord(char)) for char in string]
+    logger.debug("CALLED: strings_to_chars_to_int(string: str) -> list[int]:")
+    # bytes -> list of ints runs entirely in C; code points are needed beyond ASCII
+    return list(string.encode('ascii')) if string.isascii() else [ord(char) for char in string]
 
 @mcp.tool()
 def int_list_to_exponential_sum(int_list: list) -> float:
     """Return sum of exponentials of numbers in a list"""
-    print("CALLED: int_list_to_exponential_sum(int_list: list) -> float:")
+    logger.debug("CALLED: int_list_to_exponential_sum(int_list: list) -> float:")
+    if np is not None:
+        # Same contract as math.exp: real numbers only (no numeric strings)
+        for i in int_list:
+            if not isinstance(i, (int, float)):
+                raise TypeError(f"must be real number, not {type(i).__name__}")
+        arr = np.fromiter(int_list, dtype=np.float64, count=len(int_list))
+        with np.errstate(over='ignore'):
+            exps = np.exp(arr)
+        # math.exp raises where a finite input overflows; numpy gives inf
+        if (np.isinf(exps) & np.isfinite(arr)).any():
+            raise OverflowError("math range error")
+        return float(exps.sum())
     return sum(math.exp(i) for i in int_list)
 
+@lru_cache(maxsize=128)
+def _fib_prefix(n: int) -> tuple:
+    """First n Fibonacci numbers"""
+    out = [0] * n
+    a, b = 0, 1
+    for i in range(n):
+        out[i] = a
+        a, b = b, a + b
+    return tuple(out)
+
 @mcp.tool()
 def fibonacci_numbers(n: int) -> list:
     """Return the first n Fibonacci Numbers"""
-    print("CALLED: fibonacci_numbers(n: int) -> list:")
+    logger.debug("CALLED: fibonacci_numbers(n: int) -> list:")
     if n <= 0:
         return []
-    fib_sequence = [0, 1]
-    for _ in range(2, n):
-        fib_sequence.append(fib_sequence[-1] + fib_sequence[-2])
-    return fib_sequence[:n]
+    return list(_fib_prefix(n))
 
 
 # Global variable to store the image path
 current_image_path = None
 
+# In-memory canvas and its drawing context, so each primitive doesn't re-decode the PNG
+_current_img = None
+_current_draw = None
+
+# First available system font, resolved once at import
+_FONT_PATHS = (
+    '/System/Library/Fonts/Helvetica.ttc',
+    '/System/Library/Fonts/SFNSDisplay.ttf',
+    '/Library/Fonts/Arial.ttf'
+)
+_FONT_PATH = next((p for p in _FONT_PATHS if os.path.exists(p)), None)
+
+# Loaded fonts, keyed by font_size
+_font_cache = {}
+
+def _get_font(font_size: int):
+    """Return the cached font for this size, loading it on first use"""
+    font = _font_cache.get(font_size)
+    if font is None:
+        from PIL import ImageFont
+        try:
+            font = ImageFont.truetype(_FONT_PATH, font_size) if _FONT_PATH else ImageFont.load_default()
+        except Exception:
+            font = ImageFont.load_default()
+        _font_cache[font_size] = font
+    return font
+
+# Reloads the open canvas in place instead of closing and reopening the window
+_REFRESH_PREVIEW_SCRIPT = '''
+tell application "Preview"
+    activate
+    try
+        revert front document
+    end try
+end tell
+'''
+
+# Last osascript refresh, reaped before the next one starts so none are left as zombies
+_refresh_proc = None
+
+def _refresh_preview():
+    """Ask Preview to reload the canvas without waiting for osascript to finish"""
+    global _refresh_proc
+    import subprocess
+    if _refresh_proc is not None:
+        if _refresh_proc.poll() is None:
+            # The new refresh reloads everything the old one would have
+            _refresh_proc.terminate()
+        _refresh_proc.wait()
+    _refresh_proc = subprocess.Popen(['osascript', '-e', _REFRESH_PREVIEW_SCRIPT])
+
 @mcp.tool()
 def open_preview_with_canvas(width: int = 800, height: int = 600) -> dict:
     """Open Preview app with a blank canvas. This opens the app visually on screen."""
-    global current_image_path
-    print(f"CALLED: open_preview_with_canvas(width={width}, height={height})")
+    global current_image_path, _current_img, _current_draw
+    logger.debug("CALLED: open_preview_with_canvas(width=%s, height=%s)", width, height)
     try:
+        # PIL and subprocess are only needed once the Preview tools are used
+        import subprocess
+        from PIL import Image as PILImage, ImageDraw
+        
         # Create a white canvas
-        img = PILImage.new('RGB', (width, height), color='white')
+        _current_img = PILImage.new('RGB', (width, height), color='white')
+        _current_draw = ImageDraw.Draw(_current_img)
         
         # Save to temp file
         current_image_path = '/tmp/mcp_canvas.png'
-        img.save(current_image_path)
+        _current_img.save(current_image_path)
         
         # Open in Preview (this opens the app visually)
         if platform.system() == 'Darwin':  # macOS
@@ -189,35 +218,25 @@ def open_preview_with_canvas(width: int = 800, height: int = 600) -> dict:
 def draw_rectangle_in_preview(x1: int, y1: int, x2: int, y2: int, color: str = "red") -> dict:
     """Draw a rectangle in the Preview window. Preview must be open first."""
     global current_image_path
-    print(f"CALLED: draw_rectangle_in_preview({x1}, {y1}, {x2}, {y2}, {color})")
+    logger.debug("CALLED: draw_rectangle_in_preview(%s, %s, %s, %s, %s)", x1, y1, x2, y2, color)
     try:
-        if not current_image_path or not os.path.exists(current_image_path):
+        if _current_img is None:
             return {
                 "success": False,
                 "message": "Preview not open. Please call open_preview_with_canvas first."
             }
         
-        # Open the existing image
-        img = PILImage.open(current_image_path)
-        draw = ImageDraw.Draw(img)
+        # Draw on the cached canvas
+        draw = _current_draw
         
         # Draw rectangle with thick border
         draw.rectangle([x1, y1, x2, y2], outline=color, width=5)
         
-        # Save the image
-        img.save(current_image_path)
+        # Save the image for Preview to pick up
+        _current_img.save(current_image_path)
         
         # Refresh Preview using AppleScript
-        applescript = f'''
-        tell application "Preview"
-            activate
-            close every window
-            delay 0.5
-            open POSIX file "{current_image_path}"
-        end tell
-        '''
-        subprocess.run(['osascript', '-e', applescript])
-        time.sleep(0.5)
+        _refresh_preview()
         
         return {
             "success": True,
@@ -234,52 +253,28 @@ def draw_rectangle_in_preview(x1: int, y1: int, x2: int, y2: int, color: str = "
 def add_text_in_preview(text: str, x: int = 50, y: int = 50, font_size: int = 36) -> dict:
     """Add text in the Preview window at position (x, y). Preview must be open first."""
     global current_image_path
-    print(f"CALLED: add_text_in_preview(text={text}, x={x}, y={y}, font_size={font_size})")
+    logger.debug("CALLED: add_text_in_preview(text=%s, x=%s, y=%s, font_size=%s)", text, x, y, font_size)
     try:
-        if not current_image_path or not os.path.exists(current_image_path):
+        if _current_img is None:
             return {
                 "success": False,
                 "message": "Preview not open. Please call open_preview_with_canvas first."
             }
         
-        # Open the existing image
-        img = PILImage.open(current_image_path)
-        draw = ImageDraw.Draw(img)
+        # Draw on the cached canvas
+        draw = _current_draw
         
         # Try to use a nice font
-        try:
-            font_paths = [
-                '/System/Library/Fonts/Helvetica.ttc',
-                '/System/Library/Fonts/SFNSDisplay.ttf',
-                '/Library/Fonts/Arial.ttf'
-            ]
-            font = None
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, font_size)
-                    break
-            if not font:
-                font = ImageFont.load_default()
-        except:
-            font = ImageFont.load_default()
+        font = _get_font(font_size)
         
         # Draw text
         draw.text((x, y), text, fill='black', font=font)
         
-        # Save the image
-        img.save(current_image_path)
+        # Save the image for Preview to pick up
+        _current_img.save(current_image_path)
         
         # Refresh Preview using AppleScript
-        applescript = f'''
-        tell application "Preview"
-            activate
-            close every window
-            delay 0.5
-            open POSIX file "{current_image_path}"
-        end tell
-        '''
-        subprocess.run(['osascript', '-e', applescript])
-        time.sleep(0.5)
+        _refresh_preview()
         
         return {
             "success": True,
@@ -295,8 +290,9 @@ def add_text_in_preview(text: str, x: int = 50, y: int = 50, font_size: int = 36
 @mcp.tool()
 def bring_preview_to_front() -> dict:
     """Bring Preview window to front so you can see the result."""
-    print("CALLED: bring_preview_to_front()")
+    logger.debug("CALLED: bring_preview_to_front()")
     try:
+        import subprocess
         applescript = '''
         tell application "Preview"
             activate
@@ -320,7 +316,7 @@ def bring_preview_to_front() -> dict:
 @mcp.resource("greeting://{name}")
 def get_greeting(name: str) -> str:
     """Get a personalized greeting"""
-    print("CALLED: get_greeting(name: str) -> str:")
+    logger.debug("CALLED: get_greeting(name: str) -> str:")
     return f"Hello, {name}!"
 
 
@@ -328,7 +324,6 @@ def get_greeting(name: str) -> str:
 @mcp.prompt()
 def review_code(code: str) -> str:
     return f"Please review this code:\n\n{code}"
-    print("CALLED: review_code(code: str) -> str:")
 
 
 @mcp.prompt()
@@ -340,8 +335,9 @@ def debug_error(error: str) -> list[base.Message]:
     ]
 
 if __name__ == "__main__":
+    configure_logging()
     # Check if running with mcp dev command
-    print("STARTING")
+    logger.info("STARTING")
     if len(sys.argv) > 1 and sys.argv[1] == "dev":
         mcp.run()  # Run without transport for dev server
     else:
@@ -0,0 +1,68 @@
+"""
+Scalar math kernels for the calculator MCP server (example2.py)
+Compiled with Numba when it is installed, plain math functions otherwise
+"""
+import math
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+def _compile(fn):
+    """float64 -> float64 kernel; the explicit signature compiles (or loads from cache) at import"""
+    if njit is None:
+        return fn
+    # No fastmath: it would change nan/inf handling from what math gives
+    return njit("float64(float64)", cache=True)(fn)
+
+@_compile
+def _sin(x):
+    return math.sin(x)
+
+@_compile
+def _cos(x):
+    return math.cos(x)
+
+@_compile
+def _tan(x):
+    return math.tan(x)
+
+@_compile
+def _log(x):
+    return math.log(x)
+
+@_compile
+def _sqrt(x):
+    return math.sqrt(x)
+
+# Compiled kernels return nan outside the domain; math raises ValueError, so check here
+# (trig of nan is nan in math too - only +-inf raises)
+def sin(x):
+    if math.isinf(x):
+        raise ValueError("math domain error")
+    return _sin(x)
+
+def cos(x):
+    if math.isinf(x):
+        raise ValueError("math domain error")
+    return _cos(x)
+
+def tan(x):
+    if math.isinf(x):
+        raise ValueError("math domain error")
+    return _tan(x)
+
+def log(x):
+    if x <= 0:
+        raise ValueError("math domain error")
+    return _log(x)
+
+def sqrt(x):
+    if x < 0:
+        raise ValueError("math domain error")
+    return _sqrt(x)
+
+@_compile
+def cbrt(x):
+    return math.copysign(abs(x) ** (1.0 / 3.0), x)
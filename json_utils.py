@@ -0,0 +1,32 @@
+"""
+Shared JSON helpers
+Uses orjson when it is installed (the speed extra), the stdlib json module otherwise
+"""
+try:
+    import orjson
+
+    def json_loads(data):
+        """Parse a JSON str or bytes"""
+        return orjson.loads(data)
+
+    def json_dumps(obj) -> str:
+        """Indented JSON text"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+
+    def json_line(obj) -> bytes:
+        """One compact JSONL line, newline included"""
+        return orjson.dumps(obj) + b"\n"
+except ImportError:
+    import json
+
+    def json_loads(data):
+        """Parse a JSON str or bytes"""
+        return json.loads(data)
+
+    def json_dumps(obj) -> str:
+        """Indented JSON text"""
+        return json.dumps(obj, indent=2)
+
+    def json_line(obj) -> bytes:
+        """One compact JSONL line, newline included"""
+        return json.dumps(obj).encode() + b"\n"
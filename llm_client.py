@@ -0,0 +1,39 @@
+"""
+Shared Gemini client
+Configures google-generativeai once per process and hands out shared models
+"""
+import os
+from functools import lru_cache
+import google.generativeai as genai
+
+MODEL_NAME = 'gemini-2.0-flash-exp'
+
+@lru_cache(maxsize=1)
+def _configure() -> bool:
+    """Configure genai once; False if GEMINI_API_KEY is not set"""
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        return False
+    
+    # Configured once, so every caller shares the same underlying client/channel
+    genai.configure(api_key=api_key)
+    return True
+
+@lru_cache(maxsize=8)
+def get_model(name: str = MODEL_NAME, response_mime_type: str = None, response_schema=None):
+    """Return the shared GenerativeModel for this name/output type, or None if GEMINI_API_KEY is not set
+    
+    response_schema (a TypedDict or other hashable schema type) constrains
+    JSON output to that shape.
+    """
+    if not _configure():
+        return None
+    
+    generation_config = {}
+    if response_mime_type:
+        generation_config["response_mime_type"] = response_mime_type
+    if response_schema is not None:
+        generation_config["response_schema"] = response_schema
+    if generation_config:
+        return genai.GenerativeModel(name, generation_config=generation_config)
+    return genai.GenerativeModel(name)
@@ -0,0 +1,15 @@
+"""
+Shared logging setup
+Modules log through logging.getLogger(__name__); entry points call configure_logging() once
+"""
+import logging
+import os
+import sys
+
+def configure_logging():
+    """Log to stderr (stdout is the MCP stdio channel); DEBUG only when MCP_DEBUG is set"""
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.DEBUG if os.environ.get("MCP_DEBUG") else logging.WARNING,
+        format="%(message)s"
+    )
@@ -2,9 +2,8 @@
 Main Orchestration Layer
 Follows talk2mcp.py pattern: LLM responds with FUNCTION_CALL or FINAL_ANSWER
 """
-import os
 import asyncio
-import json
+import logging
 from datetime import datetime
 from dotenv import load_dotenv
 from perception import PerceptionAgent
@@ -14,68 +13,114 @@ from models import ExtractedFacts, UserPreferences
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+from json_utils import json_loads
+from log_setup import configure_logging
+
 # Load environment variables from .env file
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 def print_separator():
     print("\n" + "="*80 + "\n")
 
 def reset_state():
     """Reset global state"""
-    global iteration, action_history
+    global iteration, action_history, last_final_menu_result, menu_streamed
     iteration = 0
     action_history = []
+    last_final_menu_result = None
+    menu_streamed = False
 
 # Global variables
 iteration = 0
 action_history = []
+# Most recent generate_final_menu result, kept so the final answer needs no history scan
+last_final_menu_result = None
+# Set once streamed menu text has been printed, so the final answer is not printed again
+menu_streamed = False
+
+# Marks a schema parameter without a default
+_MISSING = object()
+
+def build_tool_param_specs(tools: list) -> dict:
+    """Normalize every tool's input schema once: tool name -> [(param_name, param_type, default)]"""
+    return {
+        tool.name: [
+            (param_name, param_info.get('type', 'string'), param_info.get('default', _MISSING))
+            for param_name, param_info in (tool.inputSchema.get('properties') or {}).items()
+        ]
+        for tool in tools
+    }
+
+def _int_list(params: list, index: int) -> list:
+    """Array argument: a comma-separated value, or every remaining positional param"""
+    value = params[index]
+    if ',' in value:
+        return [int(x) for x in value.split(',')]
+    return [int(p) for p in params[index:]]
+
+_COERCE = {'integer': 'int', 'number': 'float'}
+
+def _compile_adapter(tool_name: str, param_specs: list):
+    """Generate a straight-line function mapping positional params to this tool's arguments"""
+    namespace = {"_int_list": _int_list}
+    lines = ["def adapt(p):", "    n = len(p)", "    args = {}"]
+    index = 0
+    for position, (param_name, param_type, default) in enumerate(param_specs):
+        key = repr(param_name)
+        default_name = f"_d{position}"
+        if default is not _MISSING:
+            namespace[default_name] = default
+        if index is None:
+            # Everything after an array param can only fall back to its default
+            if default is not _MISSING:
+                lines.append(f"    args[{key}] = {default_name}")
+            continue
+        if param_type == 'array':
+            lines.append(f"    if n > {index}:")
+            lines.append(f"        args[{key}] = _int_list(p, {index})")
+            index = None
+            continue
+        lines.append(f"    if n > {index}:")
+        lines.append(f"        args[{key}] = {_COERCE.get(param_type, 'str')}(p[{index}])")
+        if default is not _MISSING:
+            lines.append("    else:")
+            lines.append(f"        args[{key}] = {default_name}")
+        index += 1
+    lines.append("    return args")
+    exec(compile("\n".join(lines), f"<adapter:{tool_name}>", "exec"), namespace)
+    return namespace["adapt"]
+
+def build_tool_adapters(tool_param_specs: dict) -> dict:
+    """Compile one argument adapter per tool: tool name -> adapt(params) -> arguments"""
+    return {
+        tool_name: _compile_adapter(tool_name, param_specs)
+        for tool_name, param_specs in tool_param_specs.items()
+    }
 
-async def call_mcp_tool(session: ClientSession, tool_name: str, params: list, tools: list) -> dict:
+async def print_stream_chunk(progress: float, total: float | None, message: str | None):
+    """Progress callback that prints streamed tool output as it arrives"""
+    global menu_streamed
+    if message:
+        menu_streamed = True
+        print(message, end="", flush=True)
+
+async def call_mcp_tool(session: ClientSession, tool_name: str, params: list, tool_adapters: dict, progress_callback=None) -> dict:
     """Call a single MCP tool with parameters"""
     print(f"  🔧 Calling MCP tool: {tool_name}")
     if params:
         print(f"     Parameters: {params}")
     
     try:
-        # Find the tool schema
-        tool = next((t for t in tools if t.name == tool_name), None)
-        if not tool:
+        # Coerce params with the tool's compiled adapter
+        adapter = tool_adapters.get(tool_name)
+        if adapter is None:
             return {"error": f"Unknown tool: {tool_name}"}
-        
-        # Prepare arguments according to schema
-        arguments = {}
-        schema_properties = tool.inputSchema.get('properties', {})
-        
-        param_index = 0
-        for param_name, param_info in schema_properties.items():
-            param_type = param_info.get('type', 'string')
-            
-            if param_type == 'array':
-                # For arrays, take remaining params or parse comma-separated
-                if param_index < len(params):
-                    value = params[param_index]
-                    if ',' in value:
-                        array_values = [int(x.strip()) for x in value.split(',')]
-                    else:
-                        array_values = [int(params[i]) for i in range(param_index, len(params))]
-                    arguments[param_name] = array_values
-                param_index = len(params)
-            elif param_index < len(params):
-                value = params[param_index]
-                if param_type == 'integer':
-                    arguments[param_name] = int(value)
-                elif param_type == 'number':
-                    arguments[param_name] = float(value)
-                else:
-                    arguments[param_name] = str(value)
-                param_index += 1
-            else:
-                # Use default if available
-                if 'default' in param_info:
-                    arguments[param_name] = param_info['default']
+        arguments = adapter(params)
         
         # Call the tool
-        result = await session.call_tool(tool_name, arguments=arguments)
+        result = await session.call_tool(tool_name, arguments=arguments, progress_callback=progress_callback)
         
         # Extract result
         if hasattr(result, 'content') and result.content:
@@ -84,7 +129,7 @@ async def call_mcp_tool(session: ClientSession, tool_name: str, params: list, to
                 for item in result.content:
                     if hasattr(item, 'text'):
                         try:
-                            result_data.append(json.loads(item.text))
+                            result_data.append(json_loads(item.text))
                         except:
                             result_data.append(item.text)
                     else:
@@ -106,7 +151,7 @@ async def call_mcp_tool(session: ClientSession, tool_name: str, params: list, to
         return {"error": str(e)}
 
 async def main_async():
-    global iteration, action_history
+    global iteration, action_history, last_final_menu_result
     reset_state()
     
     print("🍽️  Welcome to North Indian Food Menu Suggester")
@@ -116,7 +161,6 @@ async def main_async():
     print("🔧 Initializing Cognitive Agents...")
     perception = PerceptionAgent()
     memory = MemoryAgent()
-    decision = DecisionAgent()
     print("✅ All agents initialized successfully")
     print_separator()
     
@@ -140,7 +184,7 @@ async def main_async():
     
     # Step 4: Extract facts
     print("🧠 PERCEPTION LAYER: Extracting facts from conversation...")
-    perceived_facts: ExtractedFacts = perception.extract_facts(user_query, user_responses)
+    perceived_facts: ExtractedFacts = perception.extract_facts(user_query, user_responses, questions)
     print(f"📤 Perception Output:")
     print(f"   Meal Type: {perceived_facts.meal_type}")
     print(f"   People: {perceived_facts.number_of_people}")
@@ -150,6 +194,7 @@ async def main_async():
     # Step 5: Retrieve memory preferences
     print("💾 MEMORY LAYER: Retrieving stored preferences...")
     user_preferences: UserPreferences = memory.get_preferences()
+    preferences_snapshot = memory.get_preferences_snapshot()
     print(f"📤 Memory Output:")
     print(f"   Taste: {user_preferences.taste}")
     print(f"   Food Style: {user_preferences.food_style}")
@@ -180,14 +225,17 @@ async def main_async():
                     print(f"   - {tool.name}")
                 print_separator()
                 
+                # Parse the tool schemas once for every call_mcp_tool below
+                tool_param_specs = build_tool_param_specs(tools)
+                tool_adapters = build_tool_adapters(tool_param_specs)
+                
                 # Prepare tools list for decision agent
                 tools_list = []
                 for tool in tools:
-                    params_list = []
-                    if 'properties' in tool.inputSchema:
-                        for param_name, param_info in tool.inputSchema['properties'].items():
-                            param_type = param_info.get('type', 'string')
-                            params_list.append(f"{param_name}:{param_type}")
+                    params_list = [
+                        f"{param_name}:{param_type}"
+                        for param_name, param_type, _ in tool_param_specs[tool.name]
+                    ]
                     
                     tools_list.append({
                         "name": tool.name,
@@ -195,12 +243,39 @@ async def main_async():
                         "params": ", ".join(params_list) if params_list else "no params"
                     })
                 
+                # Decision agent needs the tool list, so it starts once the server is up
+                decision = DecisionAgent(tools_list)
+                
+                max_iterations = 12  # Increased to allow for generate_final_menu
+                iteration = 0
+                
+                # Steps the planner marked independent run concurrently instead of one per iteration
+                independent_steps = [
+                    step for step in decision.plan_independent_tools(perceived_facts, preferences_snapshot)
+                    if step["tool"] in tool_param_specs
+                ]
+                if independent_steps:
+                    iteration += 1
+                    print(f"⚡ ACTIONS LAYER: Executing {', '.join(step['tool'] for step in independent_steps)} concurrently...")
+                    results = await asyncio.gather(*[
+                        call_mcp_tool(session, step["tool"], step["params"], tool_adapters)
+                        for step in independent_steps
+                    ])
+                    for step, result in zip(independent_steps, results):
+                        action_history.append({
+                            "iteration": iteration,
+                            "tool_name": step["tool"],
+                            "params": step["params"],
+                            "result": result
+                        })
+                    print_separator()
+                
                 # Decision-Action Loop (like talk2mcp.py)
                 print("🔄 Starting Decision-Action Loop...")
                 print_separator()
                 
-                max_iterations = 12  # Increased to allow for generate_final_menu
-                iteration = 0
+                # (tool_name, params) of every call made by the loop, to catch the LLM repeating itself
+                seen_calls = set()
                 
                 while iteration < max_iterations:
                     iteration += 1
@@ -209,11 +284,27 @@ async def main_async():
                     # Get decision from LLM
                     decision_output = decision.make_decision(
                         perceived_facts=perceived_facts,
-                        memory_data=user_preferences,
-                        action_history=action_history,
-                        tools_list=tools_list
+                        memory_data=preferences_snapshot,
+                        action_history=action_history
                     )
                     
+                    # A repeated call would only return the same result - finish with what we have
+                    if decision_output["type"] == "tool_call":
+                        call_signature = (decision_output["tool_name"], tuple(decision_output["params"]))
+                        if call_signature in seen_calls:
+                            print(f"⚠️  Repeated call to {decision_output['tool_name']} detected, stopping the loop.")
+                            if last_final_menu_result and "menu" in last_final_menu_result:
+                                final_response = last_final_menu_result["menu"]
+                            else:
+                                final_response = str(action_history[-1]["result"]) if action_history else ""
+                            decision_output = {
+                                "type": "final_answer",
+                                "final_response": final_response,
+                                "reasoning": "loop detected"
+                            }
+                        else:
+                            seen_calls.add(call_signature)
+                    
                     print(f"📤 Decision: {decision_output['type']}")
                     print(f"   Reasoning: {decision_output['reasoning']}")
                     print_separator()
@@ -225,35 +316,22 @@ async def main_async():
                         
                         # Debug: Check if menu is complete
                         final_response = decision_output["final_response"]
-                        print(f"   🔍 Debug: Final response length: {len(final_response)} chars")
+                        log.debug("Final response length: %d chars", len(final_response))
                         
                         if len(final_response) < 200:
-                            print("⚠️  Warning: Final response seems short. Checking action history...")
-                            print(f"   🔍 Debug: Action history has {len(action_history)} actions")
+                            print("⚠️  Warning: Final response seems short. Checking last menu result...")
                             
-                            # Try to get menu from history
-                            for i, action in enumerate(reversed(action_history)):
-                                tool = action.get("tool_name")
-                                print(f"   🔍 Debug: Checking action {len(action_history)-i}: {tool}")
-                                
-                                if tool == "generate_final_menu":
-                                    result = action.get("result", {})
-                                    print(f"   🔍 Debug: Found generate_final_menu result")
-                                    print(f"   🔍 Debug: Result type: {type(result)}")
-                                    print(f"   🔍 Debug: Result keys: {list(result.keys()) if isinstance(result, dict) else 'not a dict'}")
-                                    
-                                    if isinstance(result, dict) and "menu" in result:
-                                        menu = result["menu"]
-                                        print(f"   🔍 Debug: Found menu in result ({len(menu)} chars)")
-                                        print(f"   🔍 Debug: Menu preview: {menu[:100]}...")
-                                        final_response = menu
-                                        print("✅ Retrieved full menu from generate_final_menu result")
-                                    else:
-                                        print(f"   ⚠️  Debug: No 'menu' key in result!")
-                                    break
+                            if last_final_menu_result and "menu" in last_final_menu_result:
+                                final_response = last_final_menu_result["menu"]
+                                print("✅ Retrieved full menu from generate_final_menu result")
                         
-                        print("🎉 FINAL RESULT:")
-                        print(final_response)
+                        streamed_menu = last_final_menu_result.get("menu", "") if last_final_menu_result else ""
+                        if menu_streamed and final_response.strip() == streamed_menu.strip():
+                            # Already printed in full while it was streaming
+                            print("🎉 FINAL RESULT: menu shown above")
+                        else:
+                            print("🎉 FINAL RESULT:")
+                            print(final_response)
                         
                         # Save to memory
                         memory.add_meal_to_history({
@@ -269,7 +347,12 @@ async def main_async():
                         params = decision_output["params"]
                         
                         print(f"⚡ ACTIONS LAYER: Executing {tool_name}...")
-                        result = await call_mcp_tool(session, tool_name, params, tools)
+                        if tool_name == "generate_final_menu":
+                            # Show the menu while it is being generated
+                            result = await call_mcp_tool(session, tool_name, params, tool_adapters, progress_callback=print_stream_chunk)
+                            print()
+                        else:
+                            result = await call_mcp_tool(session, tool_name, params, tool_adapters)
                         
                         # Show result summary
                         if isinstance(result, dict):
@@ -278,15 +361,10 @@ async def main_async():
                             elif "date" in result:
                                 print(f"   📅 Result: {result.get('date')} ({result.get('day')})")
                             elif "menu" in result:
-                                # Show first few lines of menu
+                                # The menu itself is printed once, as a stream or as the final result
                                 menu_text = result["menu"]
-                                menu_lines = menu_text.split('\n')[:8]
                                 print(f"   📊 Result: Menu generated ({len(menu_text)} chars)")
                                 print(f"   📊 Success: {result.get('success', 'unknown')}")
-                                for line in menu_lines:
-                                    print(f"      {line}")
-                                if len(menu_text.split('\n')) > 8:
-                                    print(f"      ... ({len(menu_text.split('\n'))} total lines)")
                             else:
                                 print(f"   📊 Result: {str(result)[:100]}...")
                         else:
@@ -303,10 +381,11 @@ async def main_async():
                         
                         # Debug: If this was generate_final_menu, verify the result
                         if tool_name == "generate_final_menu" and isinstance(result, dict):
+                            last_final_menu_result = result
                             if "menu" in result:
-                                print(f"   🔍 Debug: Stored menu in history ({len(result['menu'])} chars)")
+                                log.debug("Stored menu in history (%d chars)", len(result["menu"]))
                             else:
-                                print(f"   ⚠️  Debug: No 'menu' key in result! Keys: {list(result.keys())}")
+                                log.debug("No 'menu' key in result! Keys: %s", list(result.keys()))
                         
                         print(f"🔁 Feeding result back to Decision Layer...")
                         print_separator()
@@ -326,6 +405,7 @@ async def main_async():
 
 def main():
     """Entry point"""
+    configure_logging()
     asyncio.run(main_async())
 
 if __name__ == "__main__":
@@ -3,21 +3,45 @@ Memory Agent
 Stores and retrieves user preferences using Pydantic models
 """
 import os
-import json
+from collections import deque
+from types import SimpleNamespace
 from models import UserPreferences
 
+from json_utils import json_loads, json_line
+
+# Meals kept in memory and in the history file
+MAX_MEAL_HISTORY = 30
+
 class MemoryAgent:
     def __init__(self):
         self.preferences_file = "user_preferences.json"
+        # Append-only, one meal per line (shared with the MCP server's save_meal_to_history)
+        self.history_file = "meal_history.jsonl"
         self.preferences = self._load_preferences()
+        # Live meal history; the bounded deque drops the oldest meal on append
+        self._history = deque(self.preferences.meal_history, maxlen=MAX_MEAL_HISTORY)
+        # Plain read-only copy of the static preference fields for the decision loop
+        self._snapshot = SimpleNamespace(**self.preferences.model_dump(exclude={"meal_history"}))
     
     def _load_preferences(self) -> UserPreferences:
         """Load preferences from file"""
+        history = self._load_history()
+        
         if os.path.exists(self.preferences_file):
             try:
-                with open(self.preferences_file, 'r') as f:
-                    data = json.load(f)
-                    return UserPreferences(**data)
+                # pydantic_core parses and validates the JSON in one pass
+                with open(self.preferences_file, 'rb') as f:
+                    preferences = UserPreferences.model_validate_json(f.read())
+                # Older files keep meal_history inline - move it to the history file
+                legacy_history = preferences.meal_history
+                if legacy_history:
+                    history = (legacy_history + history)[-MAX_MEAL_HISTORY:]
+                    self._write_history(history)
+                    preferences.meal_history = history
+                    self._save_preferences(preferences)
+                else:
+                    preferences.meal_history = history
+                return preferences
             except Exception as e:
                 print(f"⚠️  Error loading preferences: {e}")
         
@@ -28,35 +52,81 @@ class MemoryAgent:
             ingredients=["wheat flour", "pulses", "rice"],
             dietary_type="vegetarian",
             avoid_ingredients=[],
-            meal_history=[]
+            meal_history=history
         )
     
-    def _save_preferences(self):
-        """Save preferences to file"""
+    def _load_history(self) -> list:
+        """Load the last MAX_MEAL_HISTORY meals, trimming the file if it has grown past that"""
+        total = 0
+        tail = deque(maxlen=MAX_MEAL_HISTORY)
+        try:
+            with open(self.history_file, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        total += 1
+                        tail.append(line)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            print(f"⚠️  Error loading meal history: {e}")
+            return []
+        
+        history = []
+        for line in tail:
+            try:
+                history.append(json_loads(line))
+            except ValueError as e:
+                # e.g. a line left half-written by an interrupted append
+                print(f"⚠️  Skipping corrupt meal history line: {e}")
+        if total > MAX_MEAL_HISTORY or len(history) < len(tail):
+            self._write_history(history)
+        return history
+    
+    def _write_history(self, history: list):
+        """Rewrite the history file atomically"""
         try:
-            with open(self.preferences_file, 'w') as f:
-                json.dump(self.preferences.model_dump(), f, indent=2)
+            tmp_file = self.history_file + ".tmp"
+            with open(tmp_file, 'wb') as f:
+                f.writelines(json_line(meal) for meal in history)
+            os.replace(tmp_file, self.history_file)
+        except Exception as e:
+            print(f"⚠️  Error saving meal history: {e}")
+    
+    def _append_history(self, meal_data: dict):
+        """Append one meal to the history file"""
+        try:
+            with open(self.history_file, 'ab') as f:
+                f.write(json_line(meal_data))
+        except Exception as e:
+            print(f"⚠️  Error saving meal history: {e}")
+    
+    def _save_preferences(self, preferences: UserPreferences = None):
+        """Save the static preference fields to file (meal history lives in the history file)"""
+        preferences = preferences or self.preferences
+        try:
+            tmp_file = self.preferences_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                f.write(preferences.model_dump_json(indent=2, exclude={"meal_history"}))
+            os.replace(tmp_file, self.preferences_file)
         except Exception as e:
             print(f"⚠️  Error saving preferences: {e}")
     
     def get_preferences(self) -> UserPreferences:
         """Retrieve user preferences"""
+        self.preferences.meal_history = list(self._history)
         return self.preferences
     
+    def get_preferences_snapshot(self) -> SimpleNamespace:
+        """Retrieve the static preference fields as a plain namespace (no meal history)"""
+        return self._snapshot
+    
     def update_preferences(self, new_data: dict):
         """Update preferences with new information"""
         # Add to meal history
         if "meal_type" in new_data:
-            self.preferences.meal_history.append(new_data)
-            # Keep only last 30 meals
-            if len(self.preferences.meal_history) > 30:
-                self.preferences.meal_history = self.preferences.meal_history[-30:]
-        
-        self._save_preferences()
+            self.add_meal_to_history(new_data)
     
     def add_meal_to_history(self, meal_data: dict):
         """Add a meal to history"""
-        self.preferences.meal_history.append(meal_data)
-        if len(self.preferences.meal_history) > 30:
-            self.preferences.meal_history = self.preferences.meal_history[-30:]
-        self._save_preferences()
+        self._history.append(meal_data)
+        self._append_history(meal_data)
@@ -1,7 +1,7 @@
 """
 Pydantic models for structured input/output
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import List, Optional, Dict, Any
 
 # Perception Models
@@ -12,6 +12,8 @@ class UserQuery(BaseModel):
 class GeneratedQuestions(BaseModel):
     questions: List[str]
     reasoning: Optional[str] = None
+    # Facts inferable from the query alone, returned with the questions
+    preliminary_facts: Optional[Dict[str, Any]] = None
 
 class ExtractedFacts(BaseModel):
     meal_type: str
@@ -22,9 +24,23 @@ class ExtractedFacts(BaseModel):
     specific_requests: Optional[str] = ""
     constraints: List[str] = []
     
-    class Config:
-        # Allow LLM to return empty list/string for optional fields
-        str_strip_whitespace = True
+    # Allow LLM to return empty list/string for optional fields
+    model_config = ConfigDict(str_strip_whitespace=True)
+    
+    @field_validator("specific_requests", mode="before")
+    @classmethod
+    def _specific_requests_as_string(cls, value):
+        # LLMs sometimes return a list of requests or null
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            return " ".join(str(x) for x in value)
+        return value
+    
+    @field_validator("dietary_restrictions", "constraints", mode="before")
+    @classmethod
+    def _ensure_list(cls, value):
+        return value if isinstance(value, list) else []
 
 # Memory Models
 class UserPreferences(BaseModel):
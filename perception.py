@@ -2,14 +2,15 @@
 Perception Agent
 Understands and extracts facts from user input using Gemini 2 Flash with Pydantic
 """
-import google.generativeai as genai
-import os
-import json
+import re
+from functools import lru_cache
+from typing import List
+from typing_extensions import TypedDict  # typing.TypedDict is rejected by pydantic before 3.12
+from llm_client import get_model, MODEL_NAME
 from models import GeneratedQuestions, ExtractedFacts
 
-class PerceptionAgent:
-    def __init__(self):
-        self.question_prompt = """You are a Perception Agent in a North Indian Food Recommendation System.
+# Prompts are fixed, so they live at module level rather than on each instance
+QUESTION_PROMPT = """You are a Perception Agent in a North Indian Food Recommendation System.
 
 ---
 
@@ -29,7 +30,10 @@ Understand the user's query and generate 2–4 clarifying questions to collect e
 4. **Verify**
    - Ensure at least 2 and at most 4 questions are produced.
    - Check that each question directly helps improve food recommendation relevance.
-5. **Output**
+5. **Extract Preliminary Facts**
+   - From the query alone, fill in what is already known; use the defaults for anything not mentioned.
+   - `specific_requests` is a **string**, never a list.
+6. **Output**
    - Respond **only** in structured JSON as defined below.
 
 ---
@@ -39,11 +43,20 @@ Return a valid JSON object in this structure:
 ```json
 {
   "questions": ["question 1", "question 2", "question 3"],
-  "reasoning": "brief explanation of why these questions were asked"
+  "reasoning": "brief explanation of why these questions were asked",
+  "preliminary_facts": {
+    "meal_type": "breakfast/lunch/dinner/snacks",
+    "number_of_people": 2,
+    "time_available": "quick/normal/elaborate",
+    "dietary_restrictions": [],
+    "occasion": "regular/special/guests/etc",
+    "specific_requests": "",
+    "constraints": []
+  }
 }
 """
 
-        self.extraction_prompt = """You are a Perception Agent extracting structured facts from a conversation about North Indian food preferences.
+EXTRACTION_PROMPT = """You are a Perception Agent extracting structured facts from a conversation about North Indian food preferences.
 
 ---
 
@@ -92,38 +105,76 @@ Understand the user's input and extract relevant factual information into a stru
   "constraints": []
 }
 """
-        
-        # Initialize Gemini with structured output
-        api_key = os.getenv('GEMINI_API_KEY')
-        if api_key:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel(
-                'gemini-2.0-flash-exp',
-                generation_config={
-                    "response_mime_type": "application/json"
-                }
-            )
-        else:
-            self.model = None
+
+# Gemini response schemas, so output always matches the models' shape
+# (TypedDicts: Gemini schemas can't carry the pydantic models' defaults)
+class FactsSchema(TypedDict):
+    meal_type: str
+    number_of_people: int
+    time_available: str
+    dietary_restrictions: List[str]
+    occasion: str
+    specific_requests: str
+    constraints: List[str]
+
+class QuestionsSchema(TypedDict):
+    questions: List[str]
+    reasoning: str
+    preliminary_facts: FactsSchema
+
+# Fallback keyword lookups, checked in priority order: word -> meal_type
+_MEAL_KEYWORDS = (
+    ("breakfast", "breakfast"),
+    ("dinner", "dinner"),
+    ("snack", "snacks"),
+    ("snacks", "snacks"),
+    ("lunch", "lunch"),
+)
+_QUICK_KEYWORDS = frozenset({"quick", "fast", "hurry"})
+_WORD_RE = re.compile(r"[a-z]+")
+
+@lru_cache(maxsize=256)
+def _scan_query(user_query: str) -> tuple:
+    """Detect (meal_type, time_available) from one pass over the query's words"""
+    words = set(_WORD_RE.findall(user_query.lower()))
+    meal_type = next((meal for word, meal in _MEAL_KEYWORDS if word in words), "lunch")
+    time_available = "quick" if not _QUICK_KEYWORDS.isdisjoint(words) else "normal"
+    return meal_type, time_available
+
+class PerceptionAgent:
+    def __init__(self):
+        # Shared Gemini models, each constrained to its response schema
+        self.question_model = get_model(MODEL_NAME, "application/json", QuestionsSchema)
+        self.extraction_model = get_model(MODEL_NAME, "application/json", FactsSchema)
+        if self.question_model is None:
             print("⚠️  Warning: GEMINI_API_KEY not set. Using fallback mode.")
     
     def generate_questions(self, user_query: str) -> GeneratedQuestions:
         """Generate clarifying questions based on user query"""
-        if self.model:
+        if self.question_model:
             try:
-                response = self.model.generate_content(
-                    f"{self.question_prompt}\n\nUser Query: {user_query}"
+                response = self.question_model.generate_content(
+                    f"{QUESTION_PROMPT}\n\nUser Query: {user_query}"
                 )
-                data = json.loads(response.text)
-                return GeneratedQuestions(**data)
+                # Parsed and validated straight from the JSON text by pydantic_core
+                return GeneratedQuestions.model_validate_json(response.text)
             except Exception as e:
                 print(f"⚠️  Gemini API error: {e}")
                 return self._fallback_questions()
         else:
             return self._fallback_questions()
     
-    def collect_responses(self, questions: GeneratedQuestions) -> dict:
-        """Collect user responses to questions"""
+    def collect_responses(self, questions: GeneratedQuestions, answers: list = None) -> dict:
+        """Collect user responses to questions
+        
+        Frontends that already have the answers pass them in order and skip
+        the interactive prompts; missing answers are left blank.
+        """
+        if answers is not None:
+            answers = [str(a).strip() for a in answers]
+            answers += [""] * (len(questions.questions) - len(answers))
+            return dict(zip(questions.questions, answers))
+        
         responses = {}
         
         for i, question in enumerate(questions.questions, 1):
@@ -132,36 +183,33 @@ Understand the user's input and extract relevant factual information into a stru
         
         return responses
     
-    def extract_facts(self, user_query: str, user_responses: dict) -> ExtractedFacts:
-        """Extract facts from query and responses"""
-        conversation = f"Initial Query: {user_query}\n\n"
-        for q, a in user_responses.items():
-            conversation += f"Q: {q}\nA: {a}\n\n"
+    def extract_facts(self, user_query: str, user_responses: dict, questions: GeneratedQuestions = None) -> ExtractedFacts:
+        """Extract facts from query and responses
+        
+        If the user left every question blank, the preliminary facts returned
+        with the questions already cover the query, so no second call is made.
+        """
+        if self.extraction_model is None:
+            return self._fallback_extraction(user_query)
         
-        if self.model:
+        if questions and questions.preliminary_facts and not any(a.strip() for a in user_responses.values()):
             try:
-                response = self.model.generate_content(
-                    f"{self.extraction_prompt}\n\nConversation:\n{conversation}"
-                )
-                data = json.loads(response.text)
-                
-                # Clean up data before validation
-                if "specific_requests" in data:
-                    if isinstance(data["specific_requests"], list):
-                        data["specific_requests"] = " ".join(str(x) for x in data["specific_requests"])
-                    elif data["specific_requests"] is None:
-                        data["specific_requests"] = ""
-                
-                # Ensure lists are lists
-                for field in ["dietary_restrictions", "constraints"]:
-                    if field in data and not isinstance(data[field], list):
-                        data[field] = []
-                
-                return ExtractedFacts(**data)
+                return ExtractedFacts.model_validate(questions.preliminary_facts)
             except Exception as e:
-                print(f"⚠️  Gemini API error: {e}")
-                return self._fallback_extraction(user_query)
-        else:
+                print(f"⚠️  Invalid preliminary facts: {e}")
+        
+        parts = ["Initial Query: ", user_query, "\n\n"]
+        parts.extend(f"Q: {q}\nA: {a}\n\n" for q, a in user_responses.items())
+        conversation = "".join(parts)
+        
+        try:
+            response = self.extraction_model.generate_content(
+                f"{EXTRACTION_PROMPT}\n\nConversation:\n{conversation}"
+            )
+            # Field cleanup runs in ExtractedFacts' validators during parsing
+            return ExtractedFacts.model_validate_json(response.text)
+        except Exception as e:
+            print(f"⚠️  Gemini API error: {e}")
             return self._fallback_extraction(user_query)
     
     def _fallback_questions(self) -> GeneratedQuestions:
@@ -177,22 +225,7 @@ Understand the user's input and extract relevant factual information into a stru
     
     def _fallback_extraction(self, user_query: str) -> ExtractedFacts:
         """Fallback extraction without API"""
-        # Try to detect meal type from query
-        query_lower = user_query.lower()
-        meal_type = "lunch"  # default
-        if "breakfast" in query_lower:
-            meal_type = "breakfast"
-        elif "dinner" in query_lower:
-            meal_type = "dinner"
-        elif "snack" in query_lower:
-            meal_type = "snacks"
-        elif "lunch" in query_lower:
-            meal_type = "lunch"
-        
-        # Detect time constraint
-        time_available = "normal"
-        if "quick" in query_lower or "fast" in query_lower or "hurry" in query_lower:
-            time_available = "quick"
+        meal_type, time_available = _scan_query(user_query)
         
         return ExtractedFacts(
             meal_type=meal_type,
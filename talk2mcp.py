@@ -1,44 +1,128 @@
-import os
 from dotenv import load_dotenv
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 import asyncio
+import datetime
+import re
+import inspect
+import logging
 import google.generativeai as genai
+from llm_client import get_model
 from concurrent.futures import TimeoutError
 from functools import partial
+from contextlib import AsyncExitStack
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from json_utils import json_loads
+from log_setup import configure_logging
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Access your API key and initialize Gemini client correctly
-api_key = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=api_key)
+log = logging.getLogger(__name__)
 
-model = genai.GenerativeModel("gemini-2.0-flash")
+# Explicit version: context caching needs one, and both paths must use the same model
+AGENT_MODEL = "gemini-2.0-flash-001"
 
-response = model.generate_content("Hello from Gemini!")
-print(response.text)
+# Shared Gemini model (configured once in llm_client)
+model = get_model(AGENT_MODEL)
 
 
 max_iterations = 10  # Increased to allow for calculation + visualization steps
-last_response = None
-iteration = 0
-iteration_response = []
+DEFAULT_QUERY = """Find the ASCII values of characters in INDIA and then return sum of exponentials of those values. """
+# Only the most recent steps are replayed to the LLM, so the prompt stops growing
+MAX_HISTORY_STEPS = 8
+# Longest tool result kept in the step history
+MAX_RESULT_CHARS = 500
+# Gemini rejects cached contents smaller than this
+MIN_CACHE_TOKENS = 4096
+# Rough chars per token, to size the prompt without a count_tokens round-trip
+CHARS_PER_TOKEN = 4
+
+@dataclass
+class RunState:
+    """Per-run agent state, created fresh by each main() call"""
+    iteration: int = 0
+    last_response: Any = None
+    history: deque = field(default_factory=lambda: deque(maxlen=MAX_HISTORY_STEPS))
+
+# Marks a schema parameter without a default
+_MISSING = object()
+
+def _parse_array(values: list) -> list:
+    """Array param: a comma-separated value, or every remaining positional param"""
+    if ',' in values[0]:
+        return [int(x.strip()) for x in values[0].split(',')]
+    return [int(v) for v in values]
+
+def _parse_number(value: str):
+    """Number param: ints stay ints so integer ops stay exact"""
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+def _schema_type(info: dict, default: str) -> str:
+    """JSON schema type of a param; an int | float union (anyOf) counts as number"""
+    if 'type' in info:
+        return info['type']
+    type_names = {option.get('type') for option in info.get('anyOf', [])}
+    if type_names and type_names <= {'integer', 'number'}:
+        return 'number'
+    return default
+
+# Schema type -> coercion for one positional param; arrays take the remaining params
+_COERCERS = {'integer': int, 'number': _parse_number, 'string': str, 'array': _parse_array}
+
+# First FUNCTION_CALL / FUNCTION_CALLS / FINAL_ANSWER directive line in an LLM response
+# ([ \t] rather than \s, so a match never starts on or spans an earlier line)
+_CALL_RE = re.compile(r'^[ \t]*(FUNCTION_CALLS|FUNCTION_CALL|FINAL_ANSWER):[ \t]*(.*)$', re.M)
+
+async def _close_stream(response):
+    """Stop a half-read response stream so the server stops generating
+    
+    The SDK has no public cancel for AsyncGenerateContentResponse, so this
+    closes/cancels the wrapped stream iterator when it supports it.
+    """
+    iterator = getattr(response, "_iterator", None)
+    for name in ("aclose", "cancel"):
+        close = getattr(iterator, name, None)
+        if close is not None:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+            return
+
+async def _stream_until_directive(model, prompt) -> str:
+    """Stream the response, stopping once the first directive line is complete"""
+    response = await model.generate_content_async(prompt, stream=True)
+    text = ""
+    async for chunk in response:
+        try:
+            text += chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. the final finish_reason chunk)
+            continue
+        match = _CALL_RE.search(text)
+        if match and "\n" in text[match.end():]:
+            # The directive line has ended and the parser only needs it - skip generating the rest
+            await _close_stream(response)
+            break
+    return text
 
 async def generate_with_timeout(model, prompt, timeout=10):
-    """Generate content with a timeout"""
+    """Generate content with a timeout, returning the response text"""
     print("Starting LLM generation...")
     try:
-        loop = asyncio.get_event_loop()
-        response = await asyncio.wait_for(
-            loop.run_in_executor(
-                None,
-                lambda: model.generate_content(prompt)
-            ),
+        # Awaited on the event loop, no executor thread held for the request
+        text = await asyncio.wait_for(
+            _stream_until_directive(model, prompt),
             timeout=timeout
         )
         print("LLM generation completed")
-        return response
+        return text
     except TimeoutError:
         print("LLM generation timed out!")
         raise
@@ -47,86 +131,108 @@ async def generate_with_timeout(model, prompt, timeout=10):
         raise
 
 
-def reset_state():
-    """Reset all global variables to their initial state"""
-    global last_response, iteration, iteration_response
-    last_response = None
-    iteration = 0
-    iteration_response = []
+def result_content(result):
+    """Text of a call_tool result: a single string, or a list for multi-item content"""
+    if not hasattr(result, 'content'):
+        return str(result)
+    if not isinstance(result.content, list):
+        return str(result.content)
+    
+    items = [item.text if hasattr(item, 'text') else str(item) for item in result.content]
+    # If single item, unwrap it
+    return items[0] if len(items) == 1 else items
 
-async def main():
-    reset_state()  # Reset at the start of main
-    print("Starting main execution...")
+def _fmt_result(result) -> str:
+    """Step-history text for a tool result: lists as [a, b, ...], anything else via str()
+    
+    Capped at MAX_RESULT_CHARS so one large result can't bloat every later prompt.
+    """
+    if isinstance(result, list):
+        text = f"[{', '.join(map(str, result))}]"
+    else:
+        text = str(result)
+    if len(text) > MAX_RESULT_CHARS:
+        text = f"{text[:MAX_RESULT_CHARS]}... ({len(text)} chars)"
+    return text
+
+def create_agent_model(system_prompt: str):
+    """Model that carries the fixed system prompt, so each request only sends the context
+    
+    Returns (agent_model, cached_content). Gemini context caching is only used
+    when the prompt's estimated size reaches the cache's minimum; otherwise
+    cached_content is None and the prompt is sent as system_instruction.
+    """
+    if model is None:
+        return None, None
+    agent_model = genai.GenerativeModel(AGENT_MODEL, system_instruction=system_prompt)
+    n_tokens = len(system_prompt) // CHARS_PER_TOKEN
+    if n_tokens < MIN_CACHE_TOKENS:
+        log.debug("System prompt is ~%d tokens, too small for context caching", n_tokens)
+        return agent_model, None
     try:
-        # Create a single MCP server connection
-        print("Establishing connection to MCP server...")
-        server_params = StdioServerParameters(
-            command="python",
-            args=["example2.py"]
+        cached = genai.caching.CachedContent.create(
+            model=f"models/{AGENT_MODEL}",
+            system_instruction=system_prompt,
+            ttl=datetime.timedelta(minutes=10)
         )
+        print("Cached system prompt with Gemini context caching")
+        return genai.GenerativeModel.from_cached_content(cached_content=cached), cached
+    except Exception as e:
+        print(f"Context caching unavailable ({e}), using system instruction")
+        return agent_model, None
 
-        async with stdio_client(server_params) as (read, write):
-            print("Connection established, creating session...")
-            async with ClientSession(read, write) as session:
-                print("Session created, initializing...")
-                await session.initialize()
-                
-                # Get available tools
-                print("Requesting tool list...")
-                tools_result = await session.list_tools()
-                tools = tools_result.tools
-                print(f"Successfully retrieved {len(tools)} tools")
-
-                # Create system prompt with available tools
-                print("Creating system prompt...")
-                print(f"Number of tools: {len(tools)}")
-                
-                try:
-                    # First, let's inspect what a tool object looks like
-                    # if tools:
-                    #     print(f"First tool properties: {dir(tools[0])}")
-                    #     print(f"First tool example: {tools[0]}")
-                    
-                    tools_description = []
-                    for i, tool in enumerate(tools):
-                        try:
-                            # Get tool properties
-                            params = tool.inputSchema
-                            desc = getattr(tool, 'description', 'No description available')
-                            name = getattr(tool, 'name', f'tool_{i}')
-                            
-                            # Format the input schema in a more readable way
-                            if 'properties' in params:
-                                param_details = []
-                                for param_name, param_info in params['properties'].items():
-                                    param_type = param_info.get('type', 'unknown')
-                                    param_details.append(f"{param_name}: {param_type}")
-                                params_str = ', '.join(param_details)
-                            else:
-                                params_str = 'no parameters'
-
-                            tool_desc = f"{i+1}. {name}({params_str}) - {desc}"
-                            tools_description.append(tool_desc)
-                            print(f"Added description for tool: {tool_desc}")
-                        except Exception as e:
-                            print(f"Error processing tool {i}: {e}")
-                            tools_description.append(f"{i+1}. Error processing tool")
-                    
-                    tools_description = "\n".join(tools_description)
-                    print("Successfully created tools description")
-                except Exception as e:
-                    print(f"Error creating tools description: {e}")
-                    tools_description = "Error loading tools"
-                
-                print("Created system prompt...")
+def build_system_prompt(tools) -> str:
+    """System prompt listing the available tools, built once per session"""
+    print("Creating system prompt...")
+    print(f"Number of tools: {len(tools)}")
+    
+    try:
+        # First, let's inspect what a tool object looks like
+        # if tools:
+        #     print(f"First tool properties: {dir(tools[0])}")
+        #     print(f"First tool example: {tools[0]}")
+        
+        tools_description = []
+        for i, tool in enumerate(tools):
+            try:
+                # Get tool properties
+                params = tool.inputSchema
+                desc = getattr(tool, 'description', 'No description available')
+                name = getattr(tool, 'name', f'tool_{i}')
                 
-                system_prompt = f"""You are a math agent solving problems step by step. You have calculation tools AND visualization tools.
+                # Format the input schema in a more readable way
+                if 'properties' in params:
+                    param_details = []
+                    for param_name, param_info in params['properties'].items():
+                        param_type = _schema_type(param_info, 'unknown')
+                        param_details.append(f"{param_name}: {param_type}")
+                    params_str = ', '.join(param_details)
+                else:
+                    params_str = 'no parameters'
+
+                tool_desc = f"{i+1}. {name}({params_str}) - {desc}"
+                tools_description.append(tool_desc)
+                print(f"Added description for tool: {tool_desc}")
+            except Exception as e:
+                print(f"Error processing tool {i}: {e}")
+                tools_description.append(f"{i+1}. Error processing tool")
+        
+        tools_description = "\n".join(tools_description)
+        print("Successfully created tools description")
+    except Exception as e:
+        print(f"Error creating tools description: {e}")
+        tools_description = "Error loading tools"
+    
+    print("Created system prompt...")
+    
+    return f"""You are a math agent solving problems step by step. You have calculation tools AND visualization tools.
 
 Available tools:
 {tools_description}
 
 RESPOND WITH EXACTLY ONE LINE (no explanations):
 Format: FUNCTION_CALL: function_name|param1|param2|...
+Or, for calls that don't depend on each other's results: FUNCTION_CALLS: [{{"name": "function_name", "args": {{"param": value}}}}, ...]
 Or: FINAL_ANSWER: [your answer]
 
 WORKFLOW (follow in order):
@@ -145,180 +251,222 @@ PHASE 3 - FINISH:
 IMPORTANT:
 - For arrays, use comma-separated: int_list_to_exponential_sum|73,78,68,73,65
 - Don't repeat the same function call
+- Never batch Preview steps in FUNCTION_CALLS; they must run in order
 - Move to visualization ONLY after you have the final calculated answer
 - Each step should progress toward the goal
 
 Examples:
-FUNCTION_CALL: add|5|3
+FUNCTION_CALL: calc|add|5|3
 FUNCTION_CALL: strings_to_chars_to_int|INDIA
+FUNCTION_CALLS: [{{"name": "calc", "args": {{"op": "sqrt", "a": 16}}}}, {{"name": "factorial", "args": {{"a": 5}}}}]
 FINAL_ANSWER: The sum is 1.6e33 and is displayed in Preview"""
 
-                query = """Find the ASCII values of characters in INDIA and then return sum of exponentials of those values. """
-                print("Starting iteration loop...")
+# One MCP server process/session shared by every main() call
+_session = None
+_session_lock = asyncio.Lock()
+
+async def get_session():
+    """Start the MCP server on first use and return the shared (session, tools, tool_index, agent_model)"""
+    global _session
+    async with _session_lock:
+        if _session is None:
+            print("Establishing connection to MCP server...")
+            server_params = StdioServerParameters(
+                command="python",
+                args=["example2.py"]
+            )
+            stack = AsyncExitStack()
+            try:
+                read, write = await stack.enter_async_context(stdio_client(server_params))
+                print("Connection established, creating session...")
+                session = await stack.enter_async_context(ClientSession(read, write))
+                print("Session created, initializing...")
+                await session.initialize()
+                
+                # Get available tools
+                print("Requesting tool list...")
+                tools_result = await session.list_tools()
+                tools = tools_result.tools
+                print(f"Successfully retrieved {len(tools)} tools")
+            except BaseException:
+                await stack.aclose()
+                raise
+            
+            # Parse every schema once: tool name -> (tool, [(param_name, param_type, coerce, default)])
+            tool_index = {
+                t.name: (t, [
+                    (
+                        p,
+                        _schema_type(info, 'string'),
+                        _COERCERS.get(_schema_type(info, 'string'), str),
+                        info.get('default', _MISSING)
+                    )
+                    for p, info in t.inputSchema.get('properties', {}).items()
+                ])
+                for t in tools
+            }
+            
+            # The system prompt only depends on the tools - build it and its model once
+            agent_model, cached = create_agent_model(build_system_prompt(tools))
+            _session = (stack, session, tools, tool_index, agent_model, cached)
+    return _session[1:5]
+
+async def close_session():
+    """Shut down the shared MCP session and server process, and drop the cached prompt"""
+    global _session
+    if _session is not None:
+        stack, cached, _session = _session[0], _session[5], None
+        if cached is not None:
+            try:
+                cached.delete()
+            except Exception as e:
+                print(f"Could not delete cached system prompt: {e}")
+        await stack.aclose()
+
+async def main(query: str = DEFAULT_QUERY):
+    state = RunState()
+    print("Starting main execution...")
+    try:
+        # Reuses the MCP session across queries; only the first call pays for startup
+        session, tools, tool_index, agent_model = await get_session()
+        
+        print("Starting iteration loop...")
+        
+        while state.iteration < max_iterations:
+            print(f"\n--- Iteration {state.iteration + 1} ---")
+            
+            # Build context with history
+            if state.iteration == 0:
+                context = f"Query: {query}"
+            else:
+                history = "\n".join(state.history)
+                context = f"Query: {query}\n\nWhat you've done so far:\n{history}\n\nNext step:"
+            
+            # Get model's response with timeout
+            print("Preparing to generate LLM response...")
+            try:
+                response_text = (await generate_with_timeout(agent_model, context)).strip()
+                print(f"LLM Response: {response_text}")
+                
+                # Find the directive line in the response
+                match = _CALL_RE.search(response_text)
+                
+            except Exception as e:
+                print(f"Failed to get LLM response: {e}")
+                break
+
+
+            if match and match.group(1) == "FUNCTION_CALL":
+                function_info = match.group(2)
+                parts = [p.strip() for p in function_info.split("|")]
+                func_name, params = parts[0], parts[1:]
                 
-                # Use global iteration variables
-                global iteration, last_response
+                log.debug("Raw function info: %s", function_info)
+                log.debug("Split parts: %s", parts)
+                log.debug("Function name: %s", func_name)
+                log.debug("Raw parameters: %s", params)
                 
-                while iteration < max_iterations:
-                    print(f"\n--- Iteration {iteration + 1} ---")
+                try:
+                    # Find the matching tool and its parsed schema
+                    entry = tool_index.get(func_name)
+                    if not entry:
+                        log.debug("Available tools: %s", list(tool_index))
+                        raise ValueError(f"Unknown tool: {func_name}")
+                    tool, param_specs = entry
+
+                    log.debug("Found tool: %s", tool.name)
+                    log.debug("Tool schema: %s", tool.inputSchema)
+
+                    # Prepare arguments according to the tool's input schema
+                    arguments = {}
+
+                    param_index = 0
+                    for param_name, param_type, coerce, default in param_specs:
+                        log.debug("Processing parameter %s (type: %s)", param_name, param_type)
+                        
+                        if param_index >= len(params):
+                            if default is not _MISSING:
+                                # Use default if available
+                                arguments[param_name] = default
+                        elif coerce is _parse_array:
+                            # For arrays, take all remaining params or parse comma-separated
+                            arguments[param_name] = _parse_array(params[param_index:])
+                            param_index = len(params)  # Consume all remaining params
+                        else:
+                            # Convert the value to the correct type based on the schema
+                            arguments[param_name] = coerce(params[param_index])
+                            param_index += 1
+
+                    log.debug("Final arguments: %s", arguments)
+                    log.debug("Calling tool %s", func_name)
                     
-                    # Build context with history
-                    if iteration == 0:
-                        context = f"Query: {query}"
-                    else:
-                        history = "\n".join(iteration_response)
-                        context = f"Query: {query}\n\nWhat you've done so far:\n{history}\n\nNext step:"
+                    result = await session.call_tool(func_name, arguments=arguments)
+                    log.debug("Raw result: %s", result)
                     
-                    # Get model's response with timeout
-                    print("Preparing to generate LLM response...")
-                    prompt = f"{system_prompt}\n\n{context}"
-                    try:
-                        response = await generate_with_timeout(model, prompt)
-                        response_text = response.text.strip()
-                        print(f"LLM Response: {response_text}")
+                    iteration_result = result_content(result)
                         
-                        # Find the FUNCTION_CALL line in the response
-                        for line in response_text.split('\n'):
-                            line = line.strip()
-                            if line.startswith("FUNCTION_CALL:"):
-                                response_text = line
-                                break
-                        
-                    except Exception as e:
-                        print(f"Failed to get LLM response: {e}")
-                        break
+                    log.debug("Final iteration result: %s", iteration_result)
+                    
+                    # Format response clearly
+                    result_display = _fmt_result(iteration_result)
+                    
+                    state.history.append(
+                        f"✓ Step {state.iteration + 1}: {func_name} → {result_display}"
+                    )
+                    state.last_response = iteration_result
 
+                except Exception as e:
+                    log.error("Error details: %s", e)
+                    log.debug("Error type: %s", type(e))
+                    import traceback
+                    traceback.print_exc()
+                    state.history.append(f"Error in iteration {state.iteration + 1}: {str(e)}")
+                    break
+
+            elif match and match.group(1) == "FUNCTION_CALLS":
+                try:
+                    calls = json_loads(match.group(2))
+                    print(f"Calling {', '.join(call['name'] for call in calls)} concurrently")
+                    # Independent calls, so their MCP round-trips overlap
+                    results = await asyncio.gather(*(
+                        session.call_tool(call["name"], arguments=call.get("args", {}))
+                        for call in calls
+                    ))
+                    for call, result in zip(calls, results):
+                        iteration_result = result_content(result)
+                        result_display = _fmt_result(iteration_result)
+                        state.history.append(
+                            f"✓ Step {state.iteration + 1}: {call['name']} → {result_display}"
+                        )
+                        state.last_response = iteration_result
+                except Exception as e:
+                    log.error("Error details: %s", e)
+                    state.history.append(f"Error in iteration {state.iteration + 1}: {str(e)}")
+                    break
 
-                    if response_text.startswith("FUNCTION_CALL:"):
-                        _, function_info = response_text.split(":", 1)
-                        parts = [p.strip() for p in function_info.split("|")]
-                        func_name, params = parts[0], parts[1:]
-                        
-                        print(f"\nDEBUG: Raw function info: {function_info}")
-                        print(f"DEBUG: Split parts: {parts}")
-                        print(f"DEBUG: Function name: {func_name}")
-                        print(f"DEBUG: Raw parameters: {params}")
-                        
-                        try:
-                            # Find the matching tool to get its input schema
-                            tool = next((t for t in tools if t.name == func_name), None)
-                            if not tool:
-                                print(f"DEBUG: Available tools: {[t.name for t in tools]}")
-                                raise ValueError(f"Unknown tool: {func_name}")
-
-                            print(f"DEBUG: Found tool: {tool.name}")
-                            print(f"DEBUG: Tool schema: {tool.inputSchema}")
-
-                            # Prepare arguments according to the tool's input schema
-                            arguments = {}
-                            schema_properties = tool.inputSchema.get('properties', {})
-                            print(f"DEBUG: Schema properties: {schema_properties}")
-
-                            param_index = 0
-                            for param_name, param_info in schema_properties.items():
-                                param_type = param_info.get('type', 'string')
-                                
-                                print(f"DEBUG: Processing parameter {param_name} (type: {param_type})")
-                                
-                                # Convert the value to the correct type based on the schema
-                                if param_type == 'array':
-                                    # For arrays, take all remaining params or parse comma-separated
-                                    if param_index < len(params):
-                                        value = params[param_index]
-                                        if ',' in value:
-                                            # Comma-separated list
-                                            array_values = [int(x.strip()) for x in value.split(',')]
-                                        else:
-                                            # Multiple parameters are the array elements
-                                            array_values = [int(params[i]) for i in range(param_index, len(params))]
-                                        arguments[param_name] = array_values
-                                        print(f"DEBUG: Array parameter {param_name} = {array_values}")
-                                    param_index = len(params)  # Consume all remaining params
-                                elif param_index < len(params):
-                                    value = params[param_index]
-                                    print(f"DEBUG: Converting parameter {param_name} with value {value} to type {param_type}")
-                                    
-                                    if param_type == 'integer':
-                                        arguments[param_name] = int(value)
-                                    elif param_type == 'number':
-                                        arguments[param_name] = float(value)
-                                    else:
-                                        arguments[param_name] = str(value)
-                                    param_index += 1
-                                else:
-                                    # Use default if available
-                                    if 'default' in param_info:
-                                        arguments[param_name] = param_info['default']
-
-                            print(f"DEBUG: Final arguments: {arguments}")
-                            print(f"DEBUG: Calling tool {func_name}")
-                            
-                            result = await session.call_tool(func_name, arguments=arguments)
-                            print(f"DEBUG: Raw result: {result}")
-                            
-                            # Get the full result content
-                            if hasattr(result, 'content'):
-                                print(f"DEBUG: Result has content attribute")
-                                # Handle multiple content items
-                                if isinstance(result.content, list):
-                                    iteration_result = []
-                                    for item in result.content:
-                                        if hasattr(item, 'text'):
-                                            iteration_result.append(item.text)
-                                        else:
-                                            iteration_result.append(str(item))
-                                    # If single item, unwrap it
-                                    if len(iteration_result) == 1:
-                                        iteration_result = iteration_result[0]
-                                else:
-                                    iteration_result = str(result.content)
-                            else:
-                                print(f"DEBUG: Result has no content attribute")
-                                iteration_result = str(result)
-                                
-                            print(f"DEBUG: Final iteration result: {iteration_result}")
-                            
-                            # Format the response based on result type
-                            if isinstance(iteration_result, list):
-                                result_str = f"[{', '.join(str(x) for x in iteration_result)}]"
-                            else:
-                                result_str = str(iteration_result)
-                            
-                            # Format response clearly
-                            if isinstance(iteration_result, list):
-                                result_display = f"[{', '.join(str(x) for x in iteration_result)}]"
-                            else:
-                                result_display = str(iteration_result)
-                            
-                            iteration_response.append(
-                                f"✓ Step {iteration + 1}: {func_name} → {result_display}"
-                            )
-                            last_response = iteration_result
-
-                        except Exception as e:
-                            print(f"DEBUG: Error details: {str(e)}")
-                            print(f"DEBUG: Error type: {type(e)}")
-                            import traceback
-                            traceback.print_exc()
-                            iteration_response.append(f"Error in iteration {iteration + 1}: {str(e)}")
-                            break
-
-                    elif response_text.startswith("FINAL_ANSWER:"):
-                        print("\n=== Agent Execution Complete ===")
-                        final_answer = response_text.split(":", 1)[1].strip()
-                        print(f"Final Answer: {final_answer}")
-                        break
-
-                    iteration += 1
+            elif match and match.group(1) == "FINAL_ANSWER":
+                print("\n=== Agent Execution Complete ===")
+                final_answer = match.group(2).strip()
+                print(f"Final Answer: {final_answer}")
+                break
+
+            state.iteration += 1
 
     except Exception as e:
         print(f"Error in main execution: {e}")
         import traceback
         traceback.print_exc()
+
+async def run(queries: list):
+    """Answer each query over the same MCP session, then shut it down"""
+    try:
+        for query in queries:
+            await main(query)
     finally:
-        reset_state()  # Reset at the end of main
+        await close_session()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    configure_logging()
+    asyncio.run(run([DEFAULT_QUERY]))
     
     